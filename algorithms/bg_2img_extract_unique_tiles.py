@@ -1,57 +1,70 @@
-from PIL import Image
+import glob
 import os
+from typing import List
 
+import numpy as np
+from PIL import Image
 
-def process(img: Image, params: str = "") -> Image:
-    # Open the second image using the path provided in the params string
-    if not os.path.exists(params):
-        # raise FileNotFoundError(f"The image path specified in params '{params}' does not exist.")
-        img.extra_data = "Failed to open 2nd image"
-        return img
+from misc.arg_parse import argdict
+from misc.tiles import TileSet, tile_view
+
+DISPLAY_NAME = "Unique tiles across images"
+PARAMS = {'images': ''}
 
 
-    # try:
-    img2 = Image.open(params).convert('RGB')
-    # except:
-    #     return  None, "Failed to open the image"
+def find_images(params: str) -> List[str]:
+    """
+    Paths of the images to combine with the processed one.
 
-    # Extract 8x8 tiles from both images
-    def get_8x8_tiles(image: Image):
-        width, height = image.size
-        tiles = []
-        for y in range(0, height, 8):
-            for x in range(0, width, 8):
-                if x + 8 <= width and y + 8 <= height:  # Ensure we don't go out of bounds
-                    tile = image.crop((x, y, x + 8, y + 8))
-                    tiles.append(tile)
-        return tiles
+    Accepts `images=<path or glob>,<path or glob>,...` or, as before, a single path as the whole params string.
+    The processed image itself (`fname`) is never added twice.
+    """
+    if os.path.exists(params):
+        return [params]
 
-    tiles1 = get_8x8_tiles(img)
-    tiles2 = get_8x8_tiles(img2)
+    args = argdict(params)
+    own_path = os.path.normcase(os.path.abspath(str(args['fname']))) if 'fname' in args else None
 
-    # Combine both sets of tiles and find unique ones
-    all_tiles = tiles1 + tiles2
-    unique_tiles = []
+    paths = []
+    for pattern in str(args.get('images', '')).split(','):
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if os.path.normcase(os.path.abspath(path)) != own_path and path not in paths:
+                paths.append(path)
+    return paths
 
-    # Compare tiles for uniqueness (by pixel data)
-    for tile in all_tiles:
-        if not any([list(tile.getdata()) == list(unique_tile.getdata()) for unique_tile in unique_tiles]):
-            unique_tiles.append(tile)
+
+def process(img: Image, params: str = "") -> Image:
+    # Open the other images using the paths provided in the params string
+    paths = find_images(params)
+    missing = [path for path in paths if not os.path.exists(path)]
+    if not paths or missing:
+        img.extra_data = f"Failed to open {', '.join(missing) if missing else '2nd image'}"
+        return img
+
+    # Dedupe complete 8x8 tiles across all images in one linear pass, in order of first appearance
+    tile_set = TileSet()
+    stats = {}
+    for name, image in [('input', img)] + [(path, Image.open(path)) for path in paths]:
+        known = len(tile_set)
+        ids = tile_set.add(tile_view(np.asarray(image.convert('RGB')), 8, 8))
+        stats[name] = {'unique': len(np.unique(ids)), 'new': len(tile_set) - known}
+    unique = tile_set.tiles()
 
     # Determine the number of rows needed based on the maximum width of 160 pixels
     max_width = 160
     tiles_per_row = max_width // 8
-    num_rows = (len(unique_tiles) + tiles_per_row - 1) // tiles_per_row  # Ceiling division
-
-    # Create a new blank image to hold the unique tiles
-    new_img_width = min(len(unique_tiles), tiles_per_row) * 8
-    new_img_height = num_rows * 8
-    new_image = Image.new('RGB', (new_img_width, new_img_height))
+    num_rows = (len(unique) + tiles_per_row - 1) // tiles_per_row  # Ceiling division
 
-    # Paste the unique tiles into the new image
-    for index, tile in enumerate(unique_tiles):
-        x = (index % tiles_per_row) * 8
-        y = (index // tiles_per_row) * 8
-        new_image.paste(tile, (x, y))
+    # Lay the unique tiles out row by row, the last row padded with black
+    padded = np.zeros((num_rows * tiles_per_row, 8, 8, 3), dtype=np.uint8)
+    padded[:len(unique)] = unique
+    sheet = padded.reshape(num_rows, tiles_per_row, 8, 8, 3).swapaxes(1, 2).reshape(num_rows * 8, max_width, 3)
 
+    # Crop to the width actually used
+    new_img_width = min(len(unique), tiles_per_row) * 8
+    new_image = Image.fromarray(np.ascontiguousarray(sheet[:, :new_img_width]), 'RGB')
+    new_image.extra_data = {'shared unique tiles': len(unique), 'images': stats}
     return new_image
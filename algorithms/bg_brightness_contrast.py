@@ -1,59 +1,86 @@
-from typing import Dict, Any
+from typing import List
 
 import numpy as np
-from PIL import Image, ImageEnhance
+from PIL import Image
+
+from misc.arg_parse import argdict
+from misc.palette import DMG_PALETTE, quantize_indices
+from misc.profiling import stage
+
+DISPLAY_NAME = "Brightness/contrast grid"
+PARAMS = {'brightness': '1.0,1.2,1.4', 'contrast': '1.0,1.2,1.4', 'grid': 3, 'quantize': 'broadcast'}
+
+DEFAULT_LEVELS = [1.0, 1.2, 1.4]
+
+
+def parse_levels(value, grid: int) -> List[float]:
+    """
+    Reads a comma separated list of enhancement factors. Without a list, `grid` factors are spread
+    evenly over the range of the default levels.
+    """
+    if value is None:
+        if grid == len(DEFAULT_LEVELS):
+            return list(DEFAULT_LEVELS)
+        return list(np.linspace(DEFAULT_LEVELS[0], DEFAULT_LEVELS[-1], grid))
+    return [float(v) for v in str(value).split(',') if v.strip()]
+
+
+def grayscale_mean(rgb: np.ndarray) -> int:
+    """Rounded mean of the 'L' conversion, the reference value ImageEnhance.Contrast pivots around."""
+    luma = (rgb[..., 0].astype(np.uint32) * 19595 + rgb[..., 1].astype(np.uint32) * 38470 +
+            rgb[..., 2].astype(np.uint32) * 7471 + 0x8000) >> 16
+    return int(luma.mean() + 0.5)
+
+
+def blend_to_uint8(buffer: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Clips and truncates a float buffer the way Image.blend stores its result."""
+    np.clip(buffer, 0, 255, out=buffer)
+    out[...] = buffer
+    return out
 
 
 def process(image: Image.Image, params: str = "") -> Image.Image:
-    # Define the color palette
-    palette = np.array([
-        [224, 248, 208],  # Lightest gray
-        [136, 192, 112],  # Light gray
-        [52, 104, 86],  # Dark gray
-        [8, 24, 32]  # Black
-    ])
-
-    # image = image.resize((160, 160), Image.NEAREST)
-    # image = image.crop((0, 8, 160, image.height - 8))
-
-    # Define brightness and contrast adjustments
-    brightness_levels = [1.0, 1.2, 1.4]
-    contrast_levels = [1.0, 1.2, 1.4]
-
-    # Dimensions for output image
-    original_width, original_height = image.size
-    output_width, output_height = original_width * 3, original_height * 3
-    output_image = Image.new("RGB", (output_width, output_height))
-
-    # Function to find the closest color from the palette
-    def find_closest_color(pixel):
-        # Ensure pixel has 3 components (RGB)
-        pixel = np.array(pixel[:3]) if len(pixel) > 3 else np.array(pixel)
-        distances = np.sqrt(((palette - pixel) ** 2).sum(axis=1))
-        closest_color = palette[np.argmin(distances)]
-        return tuple(closest_color.astype(int))
-
-    # Process each brightness and contrast variation
-    for i, brightness_factor in enumerate(brightness_levels):
-        for j, contrast_factor in enumerate(contrast_levels):
-            # Apply brightness and contrast
-            enhancer_b = ImageEnhance.Brightness(image)
-            enhancer_c = ImageEnhance.Contrast(enhancer_b.enhance(brightness_factor))
-            adjusted_image = enhancer_c.enhance(contrast_factor)
+    args = argdict(params)
 
-            # Reduce colors to palette
-            adjusted_array = np.array(adjusted_image)
-            quantized_array = np.apply_along_axis(find_closest_color, 2, adjusted_array)
-            quantized_image = Image.fromarray(np.uint8(quantized_array), "RGB")
+    # Color palette and how pixels are snapped to it ('broadcast' is exact, 'lut' uses a 32K lookup table)
+    palette = DMG_PALETTE
+    quantize_method = args.setdefault('quantize', 'broadcast')
 
-            # Paste into the output grid
-            x_offset = i * original_width
-            y_offset = j * original_height
-            output_image.paste(quantized_image, (x_offset, y_offset))
+    # Brightness levels run along x, contrast levels along y of the output grid
+    grid = int(args.setdefault('grid', len(DEFAULT_LEVELS)))
+    brightness_levels = parse_levels(args.get('brightness'), grid)
+    contrast_levels = parse_levels(args.get('contrast'), grid)
+
+    rgb = np.asarray(image if image.mode == 'RGB' else image.convert('RGB'))
+    original_height, original_width = rgb.shape[:2]
+
+    # Preallocated output grid and working buffers shared by all variants
+    output = np.empty((original_height * len(contrast_levels), original_width * len(brightness_levels), 3),
+                      dtype=np.uint8)
+    source = rgb.astype(np.float32)
+    buffer = np.empty_like(source)
+    brightened = np.empty(rgb.shape, dtype=np.uint8)
+    adjusted = np.empty(rgb.shape, dtype=np.uint8)
 
-    return output_image
+    for i, brightness_factor in enumerate(brightness_levels):
+        # Brightness blends towards black: px * factor, computed once per level
+        np.multiply(source, np.float32(brightness_factor), out=buffer)
+        blend_to_uint8(buffer, brightened)
+        mean = np.float32(grayscale_mean(brightened))
+        brightened_float = brightened.astype(np.float32)
+
+        for j, contrast_factor in enumerate(contrast_levels):
+            # Contrast blends towards the gray mean: mean + factor * (px - mean)
+            np.subtract(brightened_float, mean, out=buffer)
+            buffer *= np.float32(contrast_factor)
+            buffer += mean
+            blend_to_uint8(buffer, adjusted)
 
+            # Reduce colors to palette, straight into the output grid
+            y_offset = j * original_height
+            x_offset = i * original_width
+            with stage("quantize"):
+                output[y_offset:y_offset + original_height, x_offset:x_offset + original_width] = \
+                    palette[quantize_indices(adjusted, palette, quantize_method)]
 
-# Retry processing the uploaded image
-# output_image = dummy_processing(input_image)
-#+ output_image.show()
+    return Image.fromarray(output, "RGB")
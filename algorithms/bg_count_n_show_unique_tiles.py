@@ -1,77 +1,119 @@
-import os
-import time
-from typing import Dict, Any, Callable
-from PIL import Image, ImageDraw, ImageTk
-from tqdm import tqdm
+from typing import Iterator, Optional, Tuple
+
 import numpy as np
-import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
-
-# Type alias for the dictionary holding tile data
-TileData = Dict[bytes, Dict[str, Any]]
-
-
-def extract_unique_tiles(image: Image.Image, tile_size: int) -> TileData:
-    width, height = image.size
-    tiles: TileData = {}
-
-    for y in range(0, height, tile_size):
-        for x in range(0, width, tile_size):
-            tile = image.crop((x, y, x + tile_size, y + tile_size))
-            tile_data = np.array(tile).tobytes()
-            if tile_data in tiles:
-                tiles[tile_data]['count'] += 1
-                tiles[tile_data]['positions'].append((x, y))
-            else:
-                tiles[tile_data] = {'tile': tile, 'count': 1, 'positions': [(x, y)]}
-
-    return tiles
-
-
-def create_combined_image_with_borders_sorted(original_image: Image.Image, tiles: TileData, tile_size: int,
-                                              gap: int) -> Image.Image:
-    width, height = original_image.size
-    unique_tiles = sorted(tiles.values(), key=lambda t: t['count'])
-
-    # Calculate the new image height
-    rows_needed = (len(unique_tiles) * (tile_size + gap)) // width + 1
-    new_image_height = height + (tile_size + 20) * rows_needed
-    new_image = Image.new('RGB', (width, new_image_height), 'white')
-    new_image.paste(original_image, (0, 0))
-    draw = ImageDraw.Draw(new_image)
-
-    # Draw borders on the original image
-    for tile_data in tiles.values():
-        count = tile_data['count']
-        if count <= 3:
-            if count == 1:
-                border_color = 'pink'
-            elif count == 2:
-                border_color = 'orange'
-            elif count == 3:
-                border_color = 'yellow'
-
-            for (x, y) in tile_data['positions']:
-                draw.rectangle([(x, y), (x + tile_size - 1, y + tile_size - 1)], outline=border_color, width=1)
-
-    # Place tiles and their counts below the original image
-    x_offset = 0
-    y_offset = height + gap
-    for tile_data in unique_tiles:
-        tile = tile_data['tile']
-        count = tile_data['count']
-
-        new_image.paste(tile, (x_offset, y_offset))
-        draw.text((x_offset, y_offset + tile_size + 2), str(count), fill='black')
-
-        x_offset += tile_size + gap
-        if x_offset + tile_size > width:
-            x_offset = 0
-            y_offset += tile_size + 20
-
-    return new_image
+from PIL import Image, ImageColor, ImageDraw
+
+from misc.indexed import with_color
+from misc.profiling import stage
+from misc.stream import BandSource, collect_bands
+from misc.tiles import TileSet, pad_to_tiles, tile_view
+
+DISPLAY_NAME = "Count and show unique tiles"
+INDEXED = True
+
+TILE_SIZE = 8
+GAP = 5
+LINE_HEIGHT = TILE_SIZE + 20  # A row of tiles and their counts below the image
+
+# Tiles that occur at most 3 times get a border in the image
+BORDER_COLORS = {1: ImageColor.getrgb('pink'), 2: ImageColor.getrgb('orange'), 3: ImageColor.getrgb('yellow')}
+
+
+def border_overlay(ids: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pixels and mask of the 1px borders around the rarely used tiles of a band of tile ids.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (rows * TILE_SIZE, cols * TILE_SIZE, 3) colors and the matching boolean mask.
+    """
+    rows, cols = ids.shape
+    tile_counts = counts[ids]
+    colors = np.zeros((rows, cols, 3), dtype=np.uint8)
+    for count, color in BORDER_COLORS.items():
+        colors[tile_counts == count] = color
+
+    edge = np.zeros((TILE_SIZE, TILE_SIZE), dtype=bool)
+    edge[[0, -1], :] = True
+    edge[:, [0, -1]] = True
+    mask = (tile_counts <= max(BORDER_COLORS))[:, None, :, None] & edge[None, :, None, :]
+    pixels = np.broadcast_to(colors[:, None, :, None], (rows, TILE_SIZE, cols, TILE_SIZE, 3))
+    return (pixels.reshape(rows * TILE_SIZE, cols * TILE_SIZE, 3),
+            mask.reshape(rows * TILE_SIZE, cols * TILE_SIZE))
+
+
+def tile_lines(tiles: np.ndarray, counts: np.ndarray, width: int,
+               spill: Optional[Tuple[np.ndarray, np.ndarray]]) -> Iterator[np.ndarray]:
+    """
+    The unique tiles sorted by count, each with its count below it, one line of tiles per band.
+
+    Borders of the partial tiles at the bottom of the image spill into the first line, like drawing
+    past the image onto the white area below it.
+    """
+    order = np.argsort(counts, kind='stable')
+    lines_needed = (len(tiles) * (TILE_SIZE + GAP)) // width + 1
+
+    x_offset, line = 0, 0
+    position = 0
+    while line < lines_needed:
+        with stage("tile list"):
+            line_image = Image.new('RGB', (width, LINE_HEIGHT), 'white')
+            if line == 0 and spill is not None:
+                line_pixels = np.array(line_image)
+                pixels, mask = spill
+                np.copyto(line_pixels[:len(mask)], pixels, where=mask[..., None])
+                line_image = Image.fromarray(line_pixels, 'RGB')
+
+            # Place tiles and their counts on this line until it is full
+            draw = ImageDraw.Draw(line_image)
+            while position < len(order):
+                tile_id = order[position]
+                line_image.paste(Image.fromarray(tiles[tile_id], 'RGB'), (x_offset, GAP))
+                draw.text((x_offset, GAP + TILE_SIZE + 2), str(counts[tile_id]), fill='black')
+                position += 1
+
+                x_offset += TILE_SIZE + GAP
+                if x_offset + TILE_SIZE > width:
+                    x_offset = 0
+                    break
+
+        yield np.asarray(line_image)
+        line += 1
+
+
+def process_stream(source: BandSource, params: str = "") -> Iterator[np.ndarray]:
+    """
+    Two passes over the bands: the first collects the unique tiles and their counts, the second draws
+    the borders. Only a band, the unique tiles and one id per tile are kept.
+
+    Indexed sources are counted by their palette indices and only expanded to RGB for the output.
+    """
+    width = source.width
+    tile_set = TileSet()
+
+    # Tiles past the right/bottom border are padded with black, like image.crop does
+    colors, fill = with_color(source.colors, (0, 0, 0)) if source.indexed else (None, 0)
+    if fill > 0xFF:
+        colors, fill = None, 0  # A full palette without black, there is no index left for the padding
+    read_bands = source.bands if colors is None else source.index_bands
+    with stage("count tiles"):
+        band_ids = [tile_set.add(tile_view(pad_to_tiles(band, TILE_SIZE, TILE_SIZE, fill), TILE_SIZE, TILE_SIZE))
+                    for band in read_bands(align=TILE_SIZE)]
+        counts = np.bincount(np.concatenate([ids.ravel() for ids in band_ids]), minlength=len(tile_set))
+
+    spill = None
+    for band, ids in zip(read_bands(align=TILE_SIZE), band_ids):
+        pixels = band if colors is None else colors[band]
+        with stage("borders"):
+            border_pixels, mask = border_overlay(ids, counts)
+            height = len(pixels)
+            np.copyto(pixels, border_pixels[:height, :width], where=mask[:height, :width, None])
+        if len(mask) > height:
+            spill = (border_pixels[height:, :width], mask[height:, :width])
+        yield pixels
+
+    tiles = tile_set.tiles()
+    yield from tile_lines(tiles if colors is None else colors[tiles[..., 0]], counts, width, spill)
 
 
 def process(img: Image, params: str = ""):
-    img = create_combined_image_with_borders_sorted(img, extract_unique_tiles(img, 8), 8, 5)
-    return img
+    return Image.fromarray(collect_bands(process_stream(BandSource(img), params)), "RGB")
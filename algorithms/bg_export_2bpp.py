@@ -0,0 +1,141 @@
+import os
+import re
+from copy import copy
+
+import numpy as np
+from PIL import Image
+
+from misc.arg_parse import argdict
+from misc.indexed import index_array
+from misc.palette import DMG_PALETTE, quantize_indices
+from misc.tiles import pack_planar, pad_to_tiles, tile_bank, tile_view
+
+DISPLAY_NAME = "Export 2bpp tile data"
+PARAMS = {'cgb': 'n', 'offset': 0, 'name': '', 'out': '', 'quantize': 'broadcast'}
+WRITES_FILES = True
+INDEXED = True
+
+TILE_SIZE = 8
+BANK_TILES = 256  # Tiles a tilemap byte can address, CGB attributes select one of two VRAM banks
+PREVIEW_COLUMNS = 16  # Tiles per row of the bank preview, like a VRAM viewer
+
+# CGB background map attribute bits
+ATTR_VRAM_BANK = 0x08
+ATTR_FLIP_X = 0x20
+ATTR_FLIP_Y = 0x40
+
+
+def symbol_name(name: str) -> str:
+    """A C identifier for a file name, e.g. 'town 2.png' -> 'town_2'."""
+    symbol = re.sub(r'\W', '_', os.path.splitext(os.path.basename(name))[0])
+    return '_' + symbol if not symbol or symbol[0].isdigit() else symbol
+
+
+def c_array(name: str, data: np.ndarray, per_line: int = 16) -> str:
+    values = [f"0x{value:02X}" for value in data.ravel().tolist()]
+    lines = [", ".join(values[i:i + per_line]) for i in range(0, len(values), per_line)]
+    return f"const unsigned char {name}[{len(values)}] = {{\n" + "".join(f"    {line},\n" for line in lines) + "};\n"
+
+
+def c_sources(symbol: str, source: str, bank: np.ndarray, tilemap: np.ndarray, attributes) -> tuple:
+    """The .h and .c files declaring and defining the tile data, tilemap and attributes."""
+    rows, cols = tilemap.shape
+    guard = symbol.upper() + "_H"
+    arrays = [(f"{symbol}_tiles", bank), (f"{symbol}_map", tilemap)]
+    if attributes is not None:
+        arrays.append((f"{symbol}_attr", attributes))
+
+    header = (f"// Generated by gb-helper from {os.path.basename(source)}\n"
+              f"#ifndef {guard}\n#define {guard}\n\n"
+              f"#define {symbol}_TILE_COUNT {len(bank)}\n"
+              f"#define {symbol}_WIDTH {cols}\n"
+              f"#define {symbol}_HEIGHT {rows}\n\n" +
+              "".join(f"extern const unsigned char {name}[{data.size}];\n" for name, data in arrays) +
+              f"\n#endif // {guard}\n")
+    body = (f"// Generated by gb-helper from {os.path.basename(source)}\n"
+            f"#include \"{symbol}.h\"\n\n" + "\n".join(c_array(name, data) for name, data in arrays))
+    return header, body
+
+
+def bank_preview(bank: np.ndarray) -> np.ndarray:
+    """The bank in DMG shades, PREVIEW_COLUMNS tiles per row, the last row padded with the lightest shade."""
+    # Unpack the planar rows back to shade indices: plane 0 holds the low bit
+    bits = np.unpackbits(bank, axis=-1)
+    shades = bits[..., 0, :] | (bits[..., 1, :] << 1)
+    rows = max(1, -(-len(bank) // PREVIEW_COLUMNS))
+    padded = np.zeros((rows * PREVIEW_COLUMNS, TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+    padded[:len(bank)] = shades
+    sheet = padded.reshape(rows, PREVIEW_COLUMNS, TILE_SIZE, TILE_SIZE).swapaxes(1, 2)
+    return DMG_PALETTE[sheet.reshape(rows * TILE_SIZE, PREVIEW_COLUMNS * TILE_SIZE)]
+
+
+def process(image: Image, params: str = "") -> Image:
+    """
+    Converts a background into a deduplicated 2bpp tile bank and its tilemap.
+
+    Colors are snapped to the four DMG shades. With cgb=y, tiles that are flipped copies of a bank tile
+    are reused and flipped by their CGB map attributes, which also select the VRAM bank past 256 tiles.
+    The preview shows the tile bank. When processing, <name>.2bpp, <name>.tilemap, <name>.attr (with cgb)
+    and a <name>.h/.c pair are written to `out`, by default the output folder of the job (outdir) or
+    next to the source image without one.
+    """
+    args = argdict(copy(params))
+    fname = str(args.setdefault('fname', 'output.png'))
+    override = args.setdefault('override', 'TBD') == 'True'
+    processing = args.setdefault('processing', 'TBD') == 'True'
+    cgb = args.setdefault('cgb', 'n') == 'y'
+    offset = int(args.setdefault('offset', 0))
+    symbol = symbol_name(str(args.get('name') or fname))
+    out_dir = str(args.get('out') or args.get('outdir') or os.path.dirname(fname))
+
+    # Shades of the image's colors only, then looked up per pixel, incomplete tiles padded with the lightest
+    indices, colors = index_array(image)
+    shades = quantize_indices(colors, DMG_PALETTE, args.setdefault('quantize', 'broadcast'))[indices]
+    tiles = tile_view(pad_to_tiles(shades, TILE_SIZE, TILE_SIZE), TILE_SIZE, TILE_SIZE)[..., 0]
+
+    # All tiles packed to planar rows at once, deduplicated on their packed bytes
+    bank, tile_indices, flip_bits = tile_bank(pack_planar(tiles), flips=cgb)
+    tile_indices = tile_indices + offset
+    limit = 2 * BANK_TILES if cgb else BANK_TILES
+    tilemap = (tile_indices % BANK_TILES).astype(np.uint8)
+    attributes = None
+    if cgb:
+        attributes = np.where(tile_indices >= BANK_TILES, ATTR_VRAM_BANK, 0).astype(np.uint8)
+        attributes |= np.where(flip_bits & 1, ATTR_FLIP_X, 0).astype(np.uint8)
+        attributes |= np.where(flip_bits & 2, ATTR_FLIP_Y, 0).astype(np.uint8)
+
+    preview = Image.fromarray(bank_preview(bank), 'RGB')
+    preview.extra_data = {'tiles': int(tile_indices.size), 'unique tiles': len(bank),
+                          'flipped': int(np.count_nonzero(flip_bits)), 'map': f"{tilemap.shape[1]}x{tilemap.shape[0]}",
+                          'bytes': int(bank.size)}
+    if len(bank) + offset > limit:
+        preview.extra_data['error'] = f"{len(bank)} tiles from offset {offset} do not fit in {limit} tiles."
+
+    if processing:
+        if 'error' in preview.extra_data:
+            raise ValueError(f"{fname}: {preview.extra_data['error']}")
+
+        base = os.path.join(out_dir, symbol)
+        contents = {base + '.2bpp': bank.tobytes(), base + '.tilemap': tilemap.tobytes()}
+        if attributes is not None:
+            contents[base + '.attr'] = attributes.tobytes()
+        header, body = c_sources(symbol, fname, bank, tilemap, attributes)
+        contents[base + '.h'] = header.encode()
+        contents[base + '.c'] = body.encode()
+
+        existing = [path for path in contents if os.path.exists(path)]
+        if existing and not override:
+            preview.extra_data = f"Skipping {fname}: Output file already exists and force_override is False."
+            return preview
+
+        os.makedirs(out_dir or '.', exist_ok=True)
+        for path, data in contents.items():
+            with open(path, 'wb') as f:
+                f.write(data)
+        # Attributes of an earlier cgb=y export would no longer match the tilemap
+        if attributes is None and os.path.exists(base + '.attr'):
+            os.remove(base + '.attr')
+        preview.outputs = list(contents)
+        preview.extra_data['written'] = list(contents)
+
+    return preview
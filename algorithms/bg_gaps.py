@@ -1,27 +1,59 @@
+import re
+
+import numpy as np
 from PIL import Image
 
+from misc.arg_parse import argdict
+
+DISPLAY_NAME = "Pixel/tile gaps"
+PARAMS = {'gap': 1, 'mode': 'pixel'}
+
+
+def parse_block_size(mode: str):
+    """
+    Returns the (width, height) of the blocks that get separated: single pixels or tiles such as '8x16'.
+    """
+    if mode == 'pixel':
+        return 1, 1
+    match = re.fullmatch(r'(\d+)x(\d+)', mode)
+    if not match:
+        raise ValueError(f"Unknown gap mode '{mode}', use 'pixel' or a tile size like '8x8' or '8x16'.")
+    return int(match.group(1)), int(match.group(2))
+
 
 def process(image: Image, params: str = "") -> Image:
+    # A leading bare number is the gap size (the original parameter format)
+    legacy_gap = re.match(r'\s*(\d+)(\s|$)', params)
+    if legacy_gap:
+        params = params[legacy_gap.end():]
+    args = argdict(params)
+
+    gap_size = int(args.setdefault('gap', legacy_gap.group(1) if legacy_gap else 1))
+    block_width, block_height = parse_block_size(str(args.setdefault('mode', 'pixel')))
 
-    params = params if not params == '' else "1"
-    gap_size = int(params)
+    source = np.asarray(image.convert('RGBA'))
 
     # Get original image dimensions
-    width, height = image.size
+    height, width = source.shape[:2]
+    cols = -(-width // block_width)
+    rows = -(-height // block_height)
 
     # Calculate new dimensions including the gaps
-    new_width = width + (width - 1) * gap_size
-    new_height = height + (height - 1) * gap_size
+    new_width = width + (cols - 1) * gap_size
+    new_height = height + (rows - 1) * gap_size
+
+    # Transparent white canvas, one gap larger than needed so every block has the same pitch
+    canvas = np.empty((rows * (block_height + gap_size), cols * (block_width + gap_size), 4), dtype=np.uint8)
+    canvas[...] = (255, 255, 255, 0)
 
-    # Create a new blank image with the new dimensions
-    new_image = Image.new("RGBA", (new_width, new_height), (255, 255, 255, 0))
+    # Pad partial blocks at the right/bottom edge, the padding is cropped away again below
+    padded = source
+    if height % block_height or width % block_width:
+        padded = np.zeros((rows * block_height, cols * block_width, 4), dtype=np.uint8)
+        padded[:height, :width] = source
 
-    # Copy pixels from the original image to the new image with gaps
-    for y in range(height):
-        for x in range(width):
-            # Calculate new positions in the image considering the gap size
-            new_x = x + x * gap_size
-            new_y = y + y * gap_size
-            new_image.putpixel((new_x, new_y), image.getpixel((x, y)))
+    # Copy all blocks into the canvas with a single strided assignment
+    canvas_blocks = canvas.reshape(rows, block_height + gap_size, cols, block_width + gap_size, 4)
+    canvas_blocks[:, :block_height, :, :block_width] = padded.reshape(rows, block_height, cols, block_width, 4)
 
-    return new_image
\ No newline at end of file
+    return Image.fromarray(np.ascontiguousarray(canvas[:new_height, :new_width]), "RGBA")
@@ -1,28 +1,38 @@
+from typing import Iterator
+
+import numpy as np
 from PIL import Image
-import hashlib
 
-def hash_patch(patch):
-    """Generate a hash for an 8x8 patch of an image."""
-    hash_obj = hashlib.md5()
-    hash_obj.update(patch.tobytes())
-    return hash_obj.hexdigest()
+from misc.stream import BandSource, collect_bands
+from misc.tiles import TileSet, tile_view
+
+DISPLAY_NAME = "Mark duplicate tiles"
+INDEXED = True
+
+
+def process_stream(source: BandSource, params: str = "") -> Iterator[np.ndarray]:
+    """Marks the tiles band by band, keeping only the current band and the set of tiles seen so far."""
+    seen_tiles = TileSet()
+    # Indexed sources are compared by their palette indices and only expanded to RGB for the output
+    bands = source.index_bands(align=8) if source.indexed else source.bands(align=8)
+    for band in bands:
+        known = len(seen_tiles)
+        ids = seen_tiles.add(tile_view(band, 8, 8))
+        pixels = source.colors[band] if source.indexed else band
+
+        # A tile is new if no earlier tile (row-major, this band or a previous one) has the same id
+        rows, cols = ids.shape
+        flat_ids = ids.ravel()
+        first_seen = np.zeros(flat_ids.size, dtype=bool)
+        first_seen[np.unique(flat_ids, return_index=True)[1]] = True
+        first_seen &= flat_ids >= known
+
+        corners = pixels[0:rows * 8:8, 0:cols * 8:8]
+        corners[first_seen.reshape(rows, cols)] = (0, 255, 255)  # RGB value for cyan
+        corners[~first_seen.reshape(rows, cols)] = (255, 105, 180)  # RGB value for pink
+        yield pixels
+
 
 def process(image: Image, params: str = "") -> Image:
     """Process the image, color the upper-left pixel of duplicate patches pink."""
-    pixels = image.load()
-    width, height = image.size
-    seen_patches = set()
-
-    for y in range(0, height, 8):
-        for x in range(0, width, 8):
-            if x + 8 <= width and y + 8 <= height:
-                patch = image.crop((x, y, x + 8, y + 8))
-                patch_hash = hash_patch(patch)
-
-                if patch_hash in seen_patches:
-                    pixels[x, y] = (255, 105, 180)  # RGB value for pink
-                else:
-                    pixels[x, y] = (0, 255, 255)  # RGB value for cyan
-                    seen_patches.add(patch_hash)
-
-    return image
+    return Image.fromarray(collect_bands(process_stream(BandSource(image), params)), "RGB")
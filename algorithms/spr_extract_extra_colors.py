@@ -1,75 +1,96 @@
 from PIL import Image
 import numpy as np
 
+from misc.arg_parse import argdict
+from misc.indexed import index_array
+from misc.palette import color_conflicts, pack_palettes
 
-def process(image: Image, params: str = "") -> Image:
-    # Background and fixed colors in RGB
-    background_color = (0, 255, 0)  # #00FF00
-    fixed_colors = np.array([
-        (7, 24, 33),  # #071821
-        (134, 192, 108),  # #86C06C
-        (224, 248, 207)  # #E0F8CF
-    ])
-
-    palette_data =dict()
-
-    width, height = image.size
-
-    # Convert image to numpy array
-    img_array = np.array(image)
-
-    # Find all unique colors in the image
-    unique_colors = np.unique(img_array.reshape(-1, img_array.shape[2]), axis=0)
+DISPLAY_NAME = "Extract extra colors"
+PARAMS = {'pack': 'none', 'tile': '8x16'}
+INDEXED = True
 
-    # Remove the background color and fixed colors from unique colors
-    new_colors = set(tuple(color) for color in unique_colors) - {tuple(background_color)} - set(
-        tuple(color) for color in fixed_colors)
-    new_colors = np.array(list(new_colors))
+# Background and fixed colors in RGB
+BACKGROUND_COLOR = np.array((0, 255, 0), dtype=np.uint8)  # #00FF00
+FIXED_COLORS = np.array([
+    (7, 24, 33),  # #071821
+    (134, 192, 108),  # #86C06C
+    (224, 248, 207)  # #E0F8CF
+], dtype=np.uint8)
 
-    # Start with a new image filled with the background color
-    new_img_array = np.full((height, width, 3), background_color, dtype=np.uint8)
 
-    # Copy the original image into the new image
-    new_img_array[0:height, 0:width] = img_array
+def parse_tile_size(value) -> tuple:
+    """Reads a WxH tile size, e.g. 8x16."""
+    width, _, height = str(value).lower().partition('x')
+    return int(width), int(height or width)
 
-    for i in range(0, len(new_colors), 3):
-        # Calculate the number of new colors to process in this batch
-        batch_size = min(3, len(new_colors) - i)
 
-        palette = []
+def palette_layers(indices: np.ndarray, new_colors: np.ndarray, pack: str, tile: tuple) -> list:
+    """
+    Groups the new colors into layers of len(FIXED_COLORS) entries.
 
-        # Create a new extended image array
-        new_height = new_img_array.shape[0] + height
-        extended_img_array = np.full((new_height, width, 3), background_color, dtype=np.uint8)
+    Without packing every entry holds one color, in sorted color order. With pack=greedy or pack=exact
+    colors that never appear in the same tile share an entry, found by coloring their conflict graph.
 
-        # Copy the existing new_img_array into the extended image array
-        extended_img_array[0:new_img_array.shape[0], 0:width] = new_img_array
-        new_img_array = extended_img_array
+    Returns:
+        list: Per layer, per entry the color indices sharing it.
+    """
+    if pack == 'none':
+        entries = [[color] for color in new_colors.tolist()]
+        return [entries[i:i + len(FIXED_COLORS)] for i in range(0, len(entries), len(FIXED_COLORS))]
+    if pack not in ('greedy', 'exact'):
+        raise ValueError(f"Unknown pack mode '{pack}', expected none, greedy or exact.")
 
-        # Process each new color and replace with the corresponding fixed color
-        for color_index in range(batch_size):
-            new_color = new_colors[i + color_index]
-            fixed_color = fixed_colors[color_index % len(fixed_colors)]
+    # Only the new colors take part, numbered 0..n-1
+    rank = np.full(int(indices.max(initial=0)) + 1, -1, dtype=np.int64)
+    rank[new_colors] = np.arange(len(new_colors))
+    adjacency = color_conflicts(rank[indices], len(new_colors), *tile)
+    layers = pack_palettes(adjacency, len(FIXED_COLORS), exact=pack == 'exact')
+    return [[new_colors[entry].tolist() for entry in layer] for layer in layers]
 
-            palette.append(list(new_color))
 
-            # Create a mask for the current new color
-            mask = np.all(img_array == new_color, axis=-1)
-
-            # Apply the mask to the new area
-            new_img_array[-height:, :, :][mask] = fixed_color
-        palette_data["palette " + str(i)] = palette
-
-    # Replace all new colors in the original image area with the background color
-    for new_color in new_colors:
-        mask = np.all(new_img_array[0:height, :, :] == new_color, axis=-1)
-        new_img_array[0:height, :, :][mask] = background_color
-
-    # remove upper part if empty
-    has_fixed_colors = any((c in img_array for c in fixed_colors))
-
-    if not has_fixed_colors:
-        new_img_array = new_img_array[height:]
+def process(image: Image, params: str = "") -> Image:
+    args = argdict(params)
+    pack = str(args.get('pack', 'none'))
+    tile = parse_tile_size(args.get('tile', '8x16'))
+
+    # Every pixel as an index into the image's unique colors, all bands are looked up from this map
+    indices, colors = index_array(image)
+    height, width = indices.shape
+    is_fixed = (colors[:, None, :] == FIXED_COLORS[None, :, :]).all(axis=-1).any(axis=-1)
+    is_background = (colors == BACKGROUND_COLOR).all(axis=-1)
+    new_colors = np.flatnonzero(~is_fixed & ~is_background)
+
+    # One band per layer of up to 3 palette entries, below the original area unless that would be empty
+    layers = palette_layers(indices, new_colors, pack, tile)
+    has_fixed_colors = bool(is_fixed.any()) or not layers
+    top = int(has_fixed_colors)
+    new_img_array = np.empty(((top + len(layers)) * height, width, 3), dtype=np.uint8)
+
+    # Original area: the new colors are replaced with the background color
+    if has_fixed_colors:
+        lut = colors.copy()
+        lut[new_colors] = BACKGROUND_COLOR
+        np.take(lut, indices, axis=0, out=new_img_array[:height])
+
+    palette_data = dict()
+    for layer_index, layer in enumerate(layers):
+        # The colors of each entry become the fixed color at its position, everything else background
+        lut = np.empty_like(colors)
+        lut[:] = BACKGROUND_COLOR
+        for fixed_color, entry in zip(FIXED_COLORS, layer):
+            lut[entry] = fixed_color
+        band = top + layer_index
+        np.take(lut, indices, axis=0, out=new_img_array[band * height:(band + 1) * height])
+
+        # Unpacked layers list one color per entry, packed ones the colors sharing each entry
+        name = "palette " + str(layer_index * len(FIXED_COLORS))
+        if pack == 'none':
+            palette_data[name] = [colors[entry[0]].tolist() for entry in layer]
+        else:
+            palette_data[name] = [colors[entry].tolist() for entry in layer]
+
+    if pack != 'none':
+        palette_data['layers'] = len(layers)
 
     # Convert the numpy array back to a PIL Image
     final_image = Image.fromarray(new_img_array)
@@ -1,9 +1,25 @@
 import hashlib
+import os
 import random
+from functools import lru_cache
 
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+from misc.arg_parse import argdict
+from misc.indexed import index_array
+from misc.profiling import stage
+from misc.tiles import first_occurrence_order, tile_keys, tile_view
+
+DISPLAY_NAME = "Find duplicate sprite tiles"
+PARAMS = {'mode': 'index', 'debug': 'n'}
+INDEXED = True
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources", "04B_03__.TTF")
+
+# Canvas each label character is pre-rendered on, larger than any glyph of the label font
+GLYPH_SIZE = (16, 16)
+
 
 def get_ndarray_hash(array: np.ndarray, algorithm: str = 'md5') -> str:
     """
@@ -36,16 +52,12 @@ def get_ndarray_hash(array: np.ndarray, algorithm: str = 'md5') -> str:
 
 # Function to divide the image into tiles
 def divide_into_tiles(image_array, tile_width, tile_height):
-    tiles = []
-    for i in range(0, image_array.shape[0], tile_height):
-        row = []
-        for j in range(0, image_array.shape[1], tile_width):
-            tile = image_array[i:i + tile_height, j:j + tile_width]
-            if tile.shape[:2] == (tile_height, tile_width):  # Ensure it's the correct shape
-                row.append(tile)
-        if row:
-            tiles.append(row)
-    return np.array(tiles)
+    # Zero-copy (rows, cols, tile_height, tile_width, C) view, incomplete tiles are left out
+    return tile_view(image_array, tile_width, tile_height)
+
+
+# Flip variants in the order they are tried, 'R' being the tile as is
+FLIPS = ['R', 'H', 'V', 'HV']
 
 
 # Function to flip a tile
@@ -65,50 +77,154 @@ def generate_color():
     return tuple([random.randint(0, 255) for _ in range(3)])
 
 
+def flip_keys(tile):
+    """Exact keys of the tile under each flip in FLIPS. The smallest one is the tile's canonical key."""
+    return [np.ascontiguousarray(flip_tile(tile, flip)).tobytes() for flip in FLIPS]
+
+
 # Function to check if a tile is already seen
-def find_tile_identifier(tile, seen_tiles):
-    flips = ['R', 'H', 'V', 'HV']
-    for flip in flips:
-        flipped_tile = flip_tile(tile, flip)
-        for seen_tile, info in seen_tiles.items():
-            if get_ndarray_hash(flipped_tile) == seen_tile:
-                # hash = get_ndarray_hash(seen_tile)
-                return info[0], info[1], flip  # Return color, number, and flip type
-    return None, None, None
+def find_tile_identifier(tile, seen_tiles, keys=None):
+    """
+    Looks a tile up in seen_tiles, which maps canonical keys to (color, number, key of the first tile seen).
 
-    # Function to process the tiles
+    Returns color, number and the first flip in FLIPS that turns the tile into the first tile seen,
+    or (None, None, None) for a new tile.
+    """
+    keys = keys if keys is not None else flip_keys(tile)
+    info = seen_tiles.get(min(keys))
+    if info is None:
+        return None, None, None
+    color, number, seen_key = info
+    return color, number, FLIPS[keys.index(seen_key)]
+
+
+def bulk_flip_ids(tiles):
+    """
+    Numbers every flip variant of every tile of the sheet at once.
+
+    Returns an int array with shape (len(FLIPS), rows, cols) where equal numbers mean equal tiles,
+    and the unique variant keys the numbers refer to.
+    """
+    variants = np.stack([tiles, tiles[..., :, ::-1, :], tiles[..., ::-1, :, :], tiles[..., ::-1, ::-1, :]])
+    unique_keys, ids = np.unique(tile_keys(variants).ravel(), return_inverse=True)
+    return ids.reshape(variants.shape[:3]), unique_keys
 
 
-def process_tiles(tiles):
+def process_tiles(tiles, mode='index', debug=False):
     height, width = len(tiles), len(tiles[0])
     # new_row_tiles = list(np.zeros((height, width, 3), dtype=int))
     new_row_tiles = [[0 for _ in range(width)] for _ in range(height)]
 
-    # new_row_tiles = [[]]
+    # Maps each tile's canonical key (smallest flip key) to (color, number, key of the first tile seen)
     seen_tiles = {}
+
+    if mode == 'bulk':
+        # All flip keys of the sheet in one pass, tiles sharing a canonical id are duplicates
+        ids, unique_keys = bulk_flip_ids(tiles)
+        flat_ids = ids.reshape(len(FLIPS), -1)
+        first, classes, _ = first_occurrence_order(flat_ids.min(axis=0))
+
+        # First flip that turns each tile into the first tile of its class
+        target = flat_ids[0, first][classes]
+        flips = np.argmax(flat_ids == target, axis=0)
+
+        for number, tile_index in enumerate(first, start=1):
+            seen_tiles[unique_keys[flat_ids[:, tile_index].min()].tobytes()] = \
+                (generate_color(), number, unique_keys[flat_ids[0, tile_index]].tobytes())
+        colors = list(seen_tiles.values())
+
+        for index in range(height * width):
+            i, j = divmod(index, width)
+            color, number, _ = colors[classes[index]]
+            flip = None if first[classes[index]] == index else FLIPS[flips[index]]
+            new_row_tiles[i][j] = number, flip, tuple(color)
+            if debug:
+                print(f"Tile at ({i},{j}) labeled as {number}{flip}")
+
+        return new_row_tiles, seen_tiles
+
     number_counter = 1
 
     for i in range(height):
         for j in range(width):
             tile = tiles[i][j]
-            color, number, flip = find_tile_identifier(tile, seen_tiles)
+            keys = flip_keys(tile)
+            color, number, flip = find_tile_identifier(tile, seen_tiles, keys)
             if color is None:
                 color = generate_color()
                 number = number_counter
                 number_counter += 1
-                hash = get_ndarray_hash(tile)
-                seen_tiles[hash] = (color, number)
+                seen_tiles[min(keys)] = (color, number, keys[0])
 
             new_row_tiles[i][j] = number, flip, tuple(color)
-            flip_label = f"{number}{flip}"
-            print(f"Tile at ({i},{j}) labeled as {flip_label}")
+            if debug:
+                print(f"Tile at ({i},{j}) labeled as {number}{flip}")
 
     return new_row_tiles, seen_tiles
 
 
+@lru_cache(maxsize=1)
+def load_font():
+    # Load a very small font for labeling
+    try:
+        return ImageFont.truetype(FONT_PATH, 8)
+    except IOError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=None)
+def glyph_atlas():
+    """
+    Renders the characters used in tile labels once. Maps each character to its
+    (mask, advance), the mask being drawn at the origin of a GLYPH_SIZE canvas.
+    """
+    font = load_font()
+    atlas = {}
+    for char in "0123456789" + "".join(FLIPS):
+        canvas = Image.new('L', GLYPH_SIZE, 0)
+        draw = ImageDraw.Draw(canvas)
+        draw.fontmode = "1"
+        draw.text((0, 0), char, fill=255, font=font)
+        atlas[char] = np.asarray(canvas) > 0, int(round(font.getlength(char)))
+    return atlas
+
+
+def blit_text(mask, position, text):
+    """Ors the atlas glyphs of `text` into a boolean mask, clipped to its bounds."""
+    atlas = glyph_atlas()
+    x, y = position
+    height, width = mask.shape
+    for char in text:
+        glyph, advance = atlas[char]
+        visible = glyph[:max(height - y, 0), :max(width - x, 0)]
+        mask[y:y + visible.shape[0], x:x + visible.shape[1]] |= visible
+        x += advance
+
+
+@lru_cache(maxsize=4096)
+def label_mask(number_str, flip_str, tile_width, tile_height):
+    """Pixels of a tile covered by its number (at 0, 1) and flip (at 0, 7) label."""
+    mask = np.zeros((tile_height, tile_width), dtype=bool)
+    blit_text(mask, (0, 1), number_str)
+    blit_text(mask, (0, 7), flip_str)
+    mask.setflags(write=False)
+    return mask
+
+
 def process(image: Image, params: str = "") -> Image:
-    # Convert the image to a numpy array without changing it to grayscale
-    image_array = np.array(image)
+    args = argdict(params)
+
+    # 'index' looks tiles up one by one, 'bulk' computes the flip keys of the whole sheet at once
+    mode = args.setdefault('mode', 'index')
+    debug = args.setdefault('debug', 'n') == 'y'
+
+    # Convert the image to a numpy array without changing it to grayscale, palette images are compared
+    # by their indices with a channel axis of one
+    if image.mode == 'P':
+        image_array, palette = index_array(image)
+        image_array = image_array[..., None]
+    else:
+        image_array, palette = np.array(image), None
 
     # Define the tile size
     tile_width = 8
@@ -118,53 +234,31 @@ def process(image: Image, params: str = "") -> Image:
     tiles = divide_into_tiles(image_array, tile_width, tile_height)
 
     # Process the tiles to get the output
-    new_row_tiles, seen_tiles = process_tiles(tiles)
+    with stage("identify tiles"):
+        new_row_tiles, seen_tiles = process_tiles(tiles, mode, debug)
 
     # Create an output image with alternating new and original rows
-    output_image_height = image_array.shape[0] * 2
-    output_image = Image.new('RGB', (image_array.shape[1], output_image_height))
+    output_array = np.zeros((image_array.shape[0] * 2, image_array.shape[1], 3), dtype=np.uint8)
+    rows, cols = tiles.shape[:2]
+    if rows and cols:
+        # (rows, label/original, tile_height, cols, tile_width, RGB) view of the used part of the output
+        grid = output_array[:rows * 2 * tile_height, :cols * tile_width].reshape(
+            rows, 2, tile_height, cols, tile_width, 3)
+
+        # Original tiles go to the odd rows
+        grid[:, 1] = (tiles[..., :3] if palette is None else palette[tiles[..., 0]]).transpose(0, 2, 1, 3, 4)
+
+        # Color blocks with white number and flip labels go to the even rows
+        with stage("render labels"):
+            colors = np.array([[color for _, _, color in row] for row in new_row_tiles], dtype=np.uint8)
+            labels = np.array([[label_mask(str(number), flip if flip is not None else '', tile_width, tile_height)
+                                for number, flip, _ in row] for row in new_row_tiles])
+        label_rows = grid[:, 0]
+        label_rows[...] = colors[:, None, :, None, :]
+        label_rows[labels.transpose(0, 2, 1, 3)] = 255
+
+    return Image.fromarray(output_array, 'RGB')
 
-    # Load a very small font for labeling
-    try:
-        font = ImageFont.truetype("resources/04B_03__.ttf", 8)
-    except IOError:
-        font = ImageFont.load_default()
-
-    # Draw the tiles with alternating rows
-    for i in range(len(tiles)):
-        for j in range(len(tiles[0])):
-            original_tile = tiles[i][j]
-            current_tile_infos = new_row_tiles[i][j]
-            number, flip, color = current_tile_infos
-
-            # Create new tile image
-            new_tile_image = Image.new('RGB', (tile_width, tile_height), color)
-            draw = ImageDraw.Draw(new_tile_image)
-
-            # Get the identifier and label
-            tile_key = get_ndarray_hash(
-                original_tile)  # tuple(map(tuple, original_tile))  # tuple(map(tuple, original_tile))
-            # if tile_key in seen_tiles:
-            #     identifier = seen_tiles[tile_key]
-            #     number, flip = identifier[1], find_tile_identifier(original_tile, seen_tiles)[2]
-            number_str = str(number)
-            flip_str = flip if flip is not None else ''
-
-            # Draw the number and flip indication
-            draw.fontmode = "1"
-            draw.text((0, 1), number_str, fill='white', font=font)
-            draw.text((0, 7), flip_str, fill='white', font=font)
-
-            # Calculate positions
-            original_tile_position = (j * tile_width, (i * 2 + 1) * tile_height)
-            new_tile_position = (j * tile_width, i * 2 * tile_height)
-
-            # Paste new tile and original tile
-            output_image.paste(new_tile_image, new_tile_position)
-            original_tile_rgb = Image.fromarray(original_tile)
-            output_image.paste(original_tile_rgb, original_tile_position)
-
-    return output_image
 
 # Example usage:
 # image = Image.open('/path/to/your/image.png')
@@ -11,11 +11,26 @@ from misc.arg_parse import argdict
 import random
 import string
 
+DISPLAY_NAME = "GB Studio sprite export (.gbsres)"
+PARAMS = {'chksum': 'TBD', 'twidth': 8, 'theight': 16, 'states': 1, 'anims': 1, 'layers': 1, 'htiles': 1,
+          'vtiles': 1, 'palettes': '1,', 'frames': '', 'dedupe': 'n', 'dedupef,,': 'n'}
+WRITES_FILES = True
+INDEXED = True
+
 
 def rnd_str(length: int) -> str:
     return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
 
 
+def without_ids(data):
+    """The JSON data without its "id" fields, which are regenerated on every export."""
+    if isinstance(data, dict):
+        return {key: without_ids(value) for key, value in data.items() if key != "id"}
+    if isinstance(data, list):
+        return [without_ids(value) for value in data]
+    return data
+
+
 def process(image: Image, params: str = "") -> Image:
     args = argdict(copy(params))
 
@@ -51,9 +66,8 @@ def process(image: Image, params: str = "") -> Image:
             return image
 
         new_json_data = image.extra_data
+        image.outputs = [json_name]
         if file_exists:
-            shutil.copy(json_name, json_name + rnd_str(6) + ".bu")
-
             with open(json_name, "r") as f:
                 original_json_data = json.load(f)
 
@@ -66,6 +80,13 @@ def process(image: Image, params: str = "") -> Image:
             new_json_data["width"] = original_json_data["width"]
             new_json_data["height"] = original_json_data["height"]
 
+            # Nothing to write (or back up) when only the ids would change, compared in their JSON form
+            if without_ids(json.loads(json.dumps(new_json_data))) == without_ids(original_json_data):
+                image.extra_data = f"Unchanged {json_name}: Ref: {is_ref}"
+                return image
+
+            shutil.copy(json_name, json_name + rnd_str(6) + ".bu")
+
         with open(json_name, "w") as f:
             json.dump(new_json_data, f, indent=2)
 
@@ -1,7 +1,16 @@
 import uuid
+
+import numpy as np
 from PIL import Image
 
 from misc.arg_parse import argdict, auto_cast
+from misc.indexed import index_array
+from misc.tiles import pack_planar, planar_flips, tile_keys, tile_view
+
+DISPLAY_NAME = "GB Studio sprite animation"
+PARAMS = {'chksum': 'TBD', 'twidth': 8, 'theight': 16, 'states': 1, 'anims': 1, 'layers': 1, 'htiles': 1,
+          'vtiles': 1, 'palettes': '1,', 'frames': '', 'dedupe': 'n', 'dedupef,,': 'n'}
+INDEXED = True
 
 
 def get_h_px_index(h_tile, frame, tile_width=8):
@@ -14,39 +23,30 @@ def get_v_px_index(v_tile, layer, animation, state, tile_height=16):
     return res
 
 
-def flip_horizontal(pixels, width, height):
-    """
-    Given a list/tuple of pixels of size (width*height),
-    return a new tuple with each row reversed (horizontal flip).
+def sheet_variants(tiles, planes):
     """
-    new_pixels = []
-    for row in range(height):
-        row_data = pixels[row * width : (row + 1) * width]
-        row_data = row_data[::-1]  # reverse
-        new_pixels.extend(row_data)
-    return tuple(new_pixels)
+    Keys of every tile's flip variants for the whole sheet at once: as is, flipped horizontally,
+    vertically and both (flip bits 0, 1, 2, 3). Equal keys mean equal tiles.
 
+    :param tiles: (np.ndarray) Palette index tiles with shape (rows, cols, tile_height, tile_width).
+    :param planes: (int) Bits per pixel of the packed planar form.
 
-def flip_vertical(pixels, width, height):
+    :return: Nested list [row][col] of 4-tuples of int keys.
     """
-    Given a list/tuple of pixels of size (width*height),
-    return a new tuple with rows in reverse order (vertical flip).
-    """
-    new_pixels = []
-    for row in range(height - 1, -1, -1):
-        row_data = pixels[row * width : (row + 1) * width]
-        new_pixels.extend(row_data)
-    return tuple(new_pixels)
+    # Horizontal flips come from the bit-reversal table, vertical flips reverse the row order
+    variants = np.stack(planar_flips(pack_planar(tiles, planes)))
+    _, ids = np.unique(tile_keys(variants).ravel(), return_inverse=True)
+    return [[tuple(keys) for keys in row] for row in ids.reshape(variants.shape[:3]).transpose(1, 2, 0).tolist()]
 
 
-def dedupe_tile(tile_pixels, seen_tiles, tile_width, tile_height, dedupeflips, h_px_index, v_px_index):
+def dedupe_tile(variants, seen_tiles, dedupeflips, h_px_index, v_px_index):
     """
     Attempt to deduplicate a tile using either exact matching or flip-aware matching.
 
-    :param tile_pixels: (list or tuple) The raw pixel data for the tile.
-    :param seen_tiles: (dict) Maps pixel-data variants -> (sliceX, sliceY, flipX, flipY)
-    :param tile_width: The tile width (e.g. 8).
-    :param tile_height: The tile height (e.g. 16).
+    :param variants: (tuple) Keys of the tile's flip variants, see sheet_variants.
+    :param seen_tiles: (dict) Maps one canonical key per tile -> (sliceX, sliceY, variants), the slice and
+                       the variant keys of the tile stored there. The canonical key is the smallest variant
+                       with dedupeflips, the unflipped tile otherwise.
     :param dedupeflips: (bool) If True, we check all flip variants. Otherwise, only no-flip.
     :param h_px_index: The tile's "would-be" sliceX if new.
     :param v_px_index: The tile's "would-be" sliceY if new.
@@ -57,52 +57,35 @@ def dedupe_tile(tile_pixels, seen_tiles, tile_width, tile_height, dedupeflips, h
        If found_flag = True, then we have deduplicated and these are the correct
        slice coordinates and flips. If found_flag = False, this tile is new.
     """
-    tile_pixels_noflip = tuple(tile_pixels)
-
-    if not dedupeflips:
-        # Dedupe is true, but flips are not considered
-        if tile_pixels_noflip in seen_tiles:
-            # Found an exact match
-            sliceX, sliceY, flipX, flipY = seen_tiles[tile_pixels_noflip]
-            return sliceX, sliceY, flipX, flipY, True
-        else:
-            # Not found; return no flips
-            return h_px_index, v_px_index, False, False, False
-
-    # If dedupeflips = True, generate all variants
-    tile_pixels_hflip = flip_horizontal(tile_pixels_noflip, tile_width, tile_height)
-    tile_pixels_vflip = flip_vertical(tile_pixels_noflip, tile_width, tile_height)
-    tile_pixels_hvflip = flip_horizontal(tile_pixels_vflip, tile_width, tile_height)
-
-    # 1) No flip
-    if tile_pixels_noflip in seen_tiles:
-        sliceX, sliceY, flipX, flipY = seen_tiles[tile_pixels_noflip]
-        return sliceX, sliceY, flipX, flipY, True
-
-    # 2) H-flip
-    if tile_pixels_hflip in seen_tiles:
-        sliceX, sliceY, orig_flipX, orig_flipY = seen_tiles[tile_pixels_hflip]
-        return sliceX, sliceY, (not orig_flipX), orig_flipY, True
-
-    # 3) V-flip
-    if tile_pixels_vflip in seen_tiles:
-        sliceX, sliceY, orig_flipX, orig_flipY = seen_tiles[tile_pixels_vflip]
-        return sliceX, sliceY, orig_flipX, (not orig_flipY), True
-
-    # 4) HV-flip
-    if tile_pixels_hvflip in seen_tiles:
-        sliceX, sliceY, orig_flipX, orig_flipY = seen_tiles[tile_pixels_hvflip]
-        return sliceX, sliceY, (not orig_flipX), (not orig_flipY), True
-
-    # Not found; tile is new, so store all flip variants
-    seen_tiles[tile_pixels_noflip] = (h_px_index, v_px_index, False, False)
-    seen_tiles[tile_pixels_hflip] = (h_px_index, v_px_index, True, False)
-    seen_tiles[tile_pixels_vflip] = (h_px_index, v_px_index, False, True)
-    seen_tiles[tile_pixels_hvflip] = (h_px_index, v_px_index, True, True)
-
+    canonical = min(variants) if dedupeflips else variants[0]
+
+    if canonical in seen_tiles:
+        sliceX, sliceY, stored = seen_tiles[canonical]
+        if not dedupeflips:
+            return sliceX, sliceY, False, False, True
+        # The flips that turn the stored tile into this one. A symmetric tile matches several, the last one
+        # is used, as when each variant was stored under its own key in flip order, so the flip bits written
+        # to the .gbsres stay the same
+        flips = len(stored) - 1 - stored[::-1].index(variants[0])
+        return sliceX, sliceY, bool(flips & 1), bool(flips & 2), True
+
+    # Not found; tile is new, so store it under its canonical form only
+    seen_tiles[canonical] = (h_px_index, v_px_index, variants)
     return h_px_index, v_px_index, False, False, False
 
 
+def sheet_size(img_width, img_height, tile_width, tile_height, state_count, anim_count, layer_count,
+               hor_tiles_per_frame, vert_tiles_per_frame, frame_count_per_anim):
+    """
+    Size the sheet needs to contain every tile the export reads. Tiles past the image border
+    read as black, like image.crop does.
+    """
+    max_frames = max(frame_count_per_anim[:anim_count], default=0)
+    width = max(img_width, hor_tiles_per_frame * max_frames * tile_width)
+    height = max(img_height, ((vert_tiles_per_frame - 1) * 2 + layer_count) * anim_count * state_count * tile_height)
+    return width, height
+
+
 def process(image: Image.Image, params: str = "") -> Image.Image:
     """
     Processes the given image, slicing it into frames based on 8x16 patches, and
@@ -162,6 +145,31 @@ def process(image: Image.Image, params: str = "") -> Image.Image:
     def gen_id():
         return str(uuid.uuid4())
 
+    # Map the sheet to palette indices once (palette images without expanding them to RGB), tiles are
+    # compared in their packed planar (2bpp) form
+    sheet_indices, sheet_colors = index_array(image)
+    sheet_width, sheet_height = sheet_size(img_width, img_height, tile_width, tile_height, state_count, anim_count,
+                                           layer_count, hor_tiles_per_frame, vert_tiles_per_frame,
+                                           frame_count_per_anim)
+    if sheet_indices.shape != (sheet_height, sheet_width):
+        # The padding is black, the smallest color, so it either is index 0 already or becomes it
+        if not len(sheet_colors) or sheet_colors[0].any():
+            sheet_colors = np.concatenate([np.zeros((1, 3), dtype=np.uint8), sheet_colors])
+            sheet_indices = sheet_indices.astype(np.min_scalar_type(len(sheet_colors) - 1)) + 1
+        padded = np.zeros((sheet_height, sheet_width), dtype=sheet_indices.dtype)
+        padded[:img_height, :img_width] = sheet_indices
+        sheet_indices = padded
+    planes = max(2, int(np.ceil(np.log2(len(sheet_colors)))))
+
+    # Per-tile results for the whole sheet, the frame loop below only assembles JSON from them
+    tiles = tile_view(sheet_indices, tile_width, tile_height)[..., 0]
+    green = np.flatnonzero(np.all(sheet_colors == (0, 255, 0), axis=1))
+    if len(green):
+        empty_tiles = np.all(tiles == green[0], axis=(2, 3)).tolist()
+    else:
+        empty_tiles = np.zeros(tiles.shape[:2], dtype=bool).tolist()
+    tile_keys_by_pos = sheet_variants(tiles, planes) if dedupe else None
+
     # Prepare the main JSON structure
     data = {
         "_resourceType": "sprite",
@@ -185,7 +193,7 @@ def process(image: Image.Image, params: str = "") -> Image.Image:
     }
 
     # Dictionary to track previously seen tile data (for deduplication)
-    # Key = tuple of pixel data (possibly flips) -> (sliceX, sliceY, flipX, flipY)
+    # Key = canonical variant key -> (sliceX, sliceY, flipX, flipY)
     seen_tiles = {}
 
     for state_index in range(state_count):
@@ -225,21 +233,19 @@ def process(image: Image.Image, params: str = "") -> Image.Image:
                             v_px_index = (v_tile_index * 2 + layer_index) * \
                                          (animation_index + 1) * (state_index + 1) * tile_height
 
-                            # Crop the tile region
-                            tile_box = (h_px_index, v_px_index, h_px_index + tile_width, v_px_index + tile_height)
-                            tile_region = image.crop(tile_box)
-                            tile_pixels = list(tile_region.getdata())
+                            tile_row = v_px_index // tile_height
+                            tile_col = h_px_index // tile_width
 
                             # 1) If it's all green, skip
-                            if all(px == (0, 255, 0) for px in tile_pixels):
+                            if empty_tiles[tile_row][tile_col]:
                                 continue
 
                             # 2) Deduplicate if asked
                             if dedupe:
                                 # This will either return a known or new slice coords + flips
                                 this_sliceX, this_sliceY, this_flipX, this_flipY, found_flag = dedupe_tile(
-                                    tile_pixels, seen_tiles, tile_width, tile_height, dedupeflips, h_px_index,
-                                    v_px_index)
+                                    tile_keys_by_pos[tile_row][tile_col], seen_tiles, dedupeflips,
+                                    h_px_index, v_px_index)
                                 if found_flag:
                                     comment += f"deduped with {h_px_index}, {v_px_index} "
                             else:
@@ -0,0 +1,169 @@
+"""
+Times every algorithm in the algorithms package on synthetic inputs of several sizes.
+
+Reports wall time (best of --repeat), tile throughput and the tracemalloc peak per algorithm and input,
+and can write the results as JSON to diff between commits. Needs neither Tk nor Windows.
+
+Run from the repository root:
+    python -m benchmarks.bench_algorithms
+    python -m benchmarks.bench_algorithms --algorithms bg_ --inputs tilemap --json bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image
+
+from misc.palette import DMG_PALETTE
+from misc.registry import load_algorithms
+
+SPRITE_BACKGROUND = (0, 255, 0)
+
+
+class BenchInput(NamedTuple):
+    name: str
+    image: Image.Image
+
+
+def synthetic_tiles(width: int, height: int, duplicate_ratio: float, colors: int, rng: np.random.Generator,
+                    tile_size: int = 8) -> np.ndarray:
+    """
+    An RGB image made of tile_size tiles, of which about `duplicate_ratio` repeat an earlier tile.
+    Pixels use the DMG shades first, then random extra colors up to `colors`.
+    """
+    palette = np.concatenate([DMG_PALETTE, rng.integers(0, 256, (max(0, colors - len(DMG_PALETTE)), 3))])
+    palette = palette[:max(1, colors)].astype(np.uint8)
+
+    rows, cols = -(-height // tile_size), -(-width // tile_size)
+    n_tiles = rows * cols
+    n_unique = max(1, min(n_tiles, round(n_tiles * (1 - duplicate_ratio))))
+    unique = rng.integers(0, len(palette), (n_unique, tile_size, tile_size))
+
+    # Every unique tile once, the rest repeats, in random order
+    layout = np.concatenate([np.arange(n_unique), rng.integers(0, n_unique, n_tiles - n_unique)])
+    rng.shuffle(layout)
+    tiles = palette[unique[layout]].reshape(rows, cols, tile_size, tile_size, 3)
+    return tiles.transpose(0, 2, 1, 3, 4).reshape(rows * tile_size, cols * tile_size, 3)[:height, :width]
+
+
+def sprite_sheet(frames: int, frame_size: int, duplicate_ratio: float, colors: int,
+                 rng: np.random.Generator) -> np.ndarray:
+    """A row of sprite frames on the green GB Studio background, each with a transparent margin."""
+    sheet = synthetic_tiles(frames * frame_size, frame_size, duplicate_ratio, colors, rng)
+    margin = frame_size // 8
+    mask = np.ones((frame_size, frame_size), dtype=bool)
+    mask[margin:-margin, margin:-margin] = False
+    sheet[np.tile(mask, (1, frames))] = SPRITE_BACKGROUND
+    return sheet
+
+
+def bench_inputs(duplicate_ratio: float, colors: int, seed: int = 0) -> List[BenchInput]:
+    rng = np.random.default_rng(seed)
+    inputs = [
+        BenchInput("screen 160x144", synthetic_tiles(160, 144, duplicate_ratio, 4, rng)),
+        BenchInput("tilemap 256x256", synthetic_tiles(256, 256, duplicate_ratio, 4, rng)),
+        BenchInput("tilemap 1024x1024", synthetic_tiles(1024, 1024, duplicate_ratio, 4, rng)),
+        BenchInput("sprites 8x32x32", sprite_sheet(8, 32, duplicate_ratio, colors, rng)),
+        BenchInput("sprites 32x32x32", sprite_sheet(32, 32, duplicate_ratio, colors, rng)),
+    ]
+    return [BenchInput(name, Image.fromarray(np.ascontiguousarray(array), "RGB")) for name, array in inputs]
+
+
+def companion_params(name: str, bench_input: BenchInput, temp_dir: str) -> str:
+    """Extra parameters an algorithm needs to do its real work on an input, e.g. files it reads besides it."""
+    if name == 'bg_2img_extract_unique_tiles':
+        # A second image of the same size, made of the input's tiles in another order
+        path = os.path.join(temp_dir, bench_input.name.replace(' ', '_') + "_companion.png")
+        if not os.path.exists(path):
+            pixels = np.asarray(bench_input.image)
+            Image.fromarray(np.roll(pixels, (len(pixels) // 16) * 8, axis=0), "RGB").save(path)
+        return " images=" + path
+    return ""
+
+
+def measure(algorithm, image: Image.Image, params: str, repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = algorithm(image.copy(), params=params)
+        timings.append(time.perf_counter() - start)
+
+    # Algorithms report missing inputs in extra_data instead of raising, such a run measured nothing
+    extra_data = getattr(result, 'extra_data', None)
+    if isinstance(extra_data, str) and extra_data.startswith("Failed"):
+        raise RuntimeError(extra_data)
+
+    # Separate run for memory, tracing slows the algorithm down
+    tracemalloc.start()
+    try:
+        algorithm(image.copy(), params=params)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(timings), 'peak_bytes': peak}
+
+
+def matches(name: str, patterns: Optional[List[str]]) -> bool:
+    return not patterns or any(pattern in name for pattern in patterns)
+
+
+def run(algorithm_patterns: Optional[List[str]], input_patterns: Optional[List[str]], repeat: int,
+        duplicate_ratio: float, colors: int) -> List[Dict]:
+    # Only the plugins from the algorithms package, not the dummy entry
+    algorithms = {name: algorithm for name, algorithm in load_algorithms().items()
+                  if hasattr(algorithm, 'module') and matches(name, algorithm_patterns)}
+    inputs = [bench_input for bench_input in bench_inputs(duplicate_ratio, colors)
+              if matches(bench_input.name, input_patterns)]
+
+    results = []
+    temp_dir = tempfile.TemporaryDirectory(prefix="bench_")
+    print(f"{'algorithm':<40} {'input':<20} {'time':>10} {'tiles/s':>12} {'peak':>10}")
+    for name, algorithm in sorted(algorithms.items()):
+        algorithm.module  # Import outside of the timed runs
+        for bench_input in inputs:
+            image = bench_input.image
+            tiles = (image.width // 8) * (image.height // 8)
+            # The same parameters the UI adds for a preview, never processing=True so nothing is written
+            params = f"fname={bench_input.name.replace(' ', '_')}.png isref=False"
+            params += companion_params(name, bench_input, temp_dir.name)
+            record = {'algorithm': name, 'input': bench_input.name, 'width': image.width, 'height': image.height,
+                      'tiles': tiles}
+            try:
+                record.update(measure(algorithm, image, params, repeat))
+                record['tiles_per_second'] = tiles / record['seconds'] if record['seconds'] else None
+                print(f"{name:<40} {bench_input.name:<20} {record['seconds'] * 1000:>8.1f}ms "
+                      f"{record['tiles_per_second'] or 0:>12,.0f} {record['peak_bytes'] / 2 ** 20:>8.1f}MB")
+            except Exception as e:
+                record['error'] = f"{type(e).__name__}: {e}"
+                print(f"{name:<40} {bench_input.name:<20} {'failed':>10}  {record['error']}")
+            results.append(record)
+    temp_dir.cleanup()
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--algorithms", nargs="*", help="Only algorithms whose name contains one of these.")
+    parser.add_argument("--inputs", nargs="*", help="Only inputs whose name contains one of these, e.g. tilemap.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case, the best is reported.")
+    parser.add_argument("--duplicates", type=float, default=0.5, help="Share of tiles repeating an earlier one.")
+    parser.add_argument("--colors", type=int, default=7, help="Colors in the sprite sheets.")
+    parser.add_argument("--json", default=None, help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    results = run(args.algorithms, args.inputs, args.repeat, args.duplicates, args.colors)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'python': platform.python_version(), 'numpy': np.__version__,
+                       'duplicates': args.duplicates, 'colors': args.colors, 'repeat': args.repeat,
+                       'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
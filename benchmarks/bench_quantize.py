@@ -0,0 +1,59 @@
+"""
+Compares the palette quantization engine against the per-pixel path bg_brightness_contrast used before.
+
+Run from the repository root:
+    python -m benchmarks.bench_quantize
+"""
+import time
+
+import numpy as np
+
+from misc.palette import DMG_PALETTE, build_lut, quantize
+
+
+def legacy_quantize(image_array: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """The original np.apply_along_axis implementation, kept as the reference."""
+    palette = palette.astype(np.int64)
+
+    def find_closest_color(pixel):
+        pixel = np.array(pixel[:3]) if len(pixel) > 3 else np.array(pixel)
+        distances = np.sqrt(((palette - pixel) ** 2).sum(axis=1))
+        closest_color = palette[np.argmin(distances)]
+        return tuple(closest_color.astype(int))
+
+    return np.uint8(np.apply_along_axis(find_closest_color, 2, image_array))
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    build_lut(DMG_PALETTE, 5)  # Table construction is cached, measure lookups only
+
+    print(f"{'size':>10} {'legacy':>10} {'broadcast':>10} {'lut':>10} {'speedup':>8} {'lut diff':>9}")
+    for width, height in [(160, 144), (256, 256), (512, 512)]:
+        image_array = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+        reference = legacy_quantize(image_array, DMG_PALETTE)
+        exact = quantize(image_array, DMG_PALETTE, "broadcast")
+        approx = quantize(image_array, DMG_PALETTE, "lut")
+        assert np.array_equal(reference, exact), "broadcast quantization differs from the legacy path"
+        lut_diff = np.any(reference != approx, axis=-1).mean()
+
+        legacy_time = best_of(lambda: legacy_quantize(image_array, DMG_PALETTE), repeat=1)
+        broadcast_time = best_of(lambda: quantize(image_array, DMG_PALETTE, "broadcast"))
+        lut_time = best_of(lambda: quantize(image_array, DMG_PALETTE, "lut"))
+
+        print(f"{width}x{height:<6} {legacy_time * 1000:>8.1f}ms {broadcast_time * 1000:>8.1f}ms "
+              f"{lut_time * 1000:>8.1f}ms {legacy_time / broadcast_time:>7.0f}x {lut_diff:>8.2%}")
+
+
+if __name__ == "__main__":
+    main()
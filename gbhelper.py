@@ -0,0 +1,146 @@
+"""
+Headless command line entry point, runs the algorithms without Tk or any other GUI module.
+
+    python -m gbhelper list
+    python -m gbhelper run <algorithm> <input-dir> [--params "..."] [--out DIR] [--jobs N] [--override] [--incremental]
+        [--indexed]
+    python -m gbhelper analyze <assets-dir> [--budget N] [--sprite-budget N] [--flips] [--sort over|tiles|name]
+        [--format text|csv|json] [--over] [--jobs N]
+"""
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+from misc.batch import BatchRunner, build_jobs
+from misc.manifest import Manifest
+from misc.registry import load_algorithms
+
+
+def run(args: argparse.Namespace) -> int:
+    processing_algorithms = load_algorithms()
+    if args.algorithm not in processing_algorithms:
+        print(f"Unknown algorithm '{args.algorithm}'. Available: {', '.join(processing_algorithms)}", file=sys.stderr)
+        return 2
+
+    if not os.path.isdir(args.input_dir):
+        print(f"Input folder '{args.input_dir}' does not exist.", file=sys.stderr)
+        return 2
+
+    # Same layout as the UI: output/<input folder name>/<name>_processed<ext>
+    output_folder_path = args.out or os.path.join('output', os.path.basename(os.path.normpath(args.input_dir)))
+    os.makedirs(output_folder_path, exist_ok=True)
+
+    manifest = Manifest.load(output_folder_path) if args.incremental else None
+    jobs, messages = build_jobs(args.input_dir, output_folder_path, args.params + " processing=True", args.override,
+                                manifest=manifest, algorithm_name=args.algorithm)
+    for message in messages:
+        print(message)
+    failures = sum(message.startswith("Error") for message in messages)
+
+    runner = BatchRunner(processing_algorithms[args.algorithm], jobs, args.jobs, indexed=args.indexed)
+    runner.start()
+    try:
+        for result in runner.iter_results():
+            image_name = result.job.image_name
+            if result.cancelled:
+                print(f"Cancelled {image_name}.")
+            elif result.error is not None:
+                failures += 1
+                print(f"Error processing {image_name}: {result.error}", file=sys.stderr)
+            else:
+                print(f"[{runner.completed}/{len(jobs)}] Processed and saved image as {result.job.output_path}")
+                if manifest is not None:
+                    manifest.record(result.job.input_path, args.algorithm, result.job.params, result.outputs)
+    except KeyboardInterrupt:
+        runner.cancel()
+        print("Cancelled.", file=sys.stderr)
+        return 130
+    finally:
+        # Whatever finished is recorded, so an interrupted build resumes where it stopped
+        if manifest is not None:
+            manifest.save()
+
+    print(f"Processed {len(jobs) - failures} of {len(jobs)} images, {failures} failed.")
+    return 1 if failures else 0
+
+
+def analyze(args: argparse.Namespace) -> int:
+    # Imported here, numpy would otherwise load for every command
+    from misc.tile_budget import BACKGROUND_BUDGET, CACHE_PATH, SORT_KEYS, TileCache, budget_rows, format_report, scan
+
+    if not os.path.isdir(args.assets_dir):
+        print(f"Assets folder '{args.assets_dir}' does not exist.", file=sys.stderr)
+        return 2
+
+    cache = TileCache(None if args.no_cache else args.cache or CACHE_PATH)
+    hashes, errors = scan(args.assets_dir, args.flips, cache, args.jobs)
+    cache.save()
+    for path, error in errors.items():
+        print(f"Error reading {path}: {error}", file=sys.stderr)
+
+    budget = args.budget if args.budget is not None else BACKGROUND_BUDGET
+    rows = sorted(budget_rows(hashes, budget, args.sprite_budget), key=SORT_KEYS[args.sort])
+    if args.over:
+        rows = [row for row in rows if row.over]
+    print(format_report(rows, args.format))
+    # Over budget fails like a failed image, so build scripts can stop on it
+    return 1 if errors or any(row.over for row in rows) else 0
+
+
+def list_algorithms(args: argparse.Namespace) -> int:
+    for name, algorithm in load_algorithms().items():
+        metadata = getattr(algorithm, 'metadata', None)
+        if not metadata:
+            print(name)
+            continue
+        print(f"{name}: {metadata['display_name']}" + (" (writes files)" if metadata['writes_files'] else "") +
+              (" (indexed)" if metadata.get('indexed') else ""))
+        for key, value in metadata['params'].items():
+            print(f"    {key}={value}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="gbhelper", description="Headless batch runner for the gb-helper algorithms.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Process every image in a folder with one algorithm.")
+    run_parser.add_argument("algorithm", help="Algorithm name, see 'gbhelper list'.")
+    run_parser.add_argument("input_dir", help="Folder with the images to process.")
+    run_parser.add_argument("--params", default="", help="Algorithm parameters, e.g. \"gap=1 mode=8x8\".")
+    run_parser.add_argument("--out", default=None, help="Output folder (default: output/<input folder name>).")
+    run_parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: CPU count).")
+    run_parser.add_argument("--override", action="store_true", help="Override existing output files.")
+    run_parser.add_argument("--incremental", action="store_true",
+                            help="Only process images that changed since the last incremental run.")
+    run_parser.add_argument("--indexed", action="store_true",
+                            help="Pass palette images to the algorithms that support them, instead of RGB.")
+    run_parser.set_defaults(handler=run)
+
+    analyze_parser = subparsers.add_parser("analyze", help="Unique tile counts of a GB Studio assets folder against "
+                                                           "the VRAM tile budgets.")
+    analyze_parser.add_argument("assets_dir", help="GB Studio assets folder, with backgrounds/ and sprites/.")
+    analyze_parser.add_argument("--budget", type=int, default=None,
+                                help="Background tiles per image and scene group (default: 192).")
+    analyze_parser.add_argument("--sprite-budget", type=int, default=None,
+                                help="8x16 sprite tiles per image and group (default: no budget).")
+    analyze_parser.add_argument("--flips", action="store_true", help="Count flipped copies of a tile once.")
+    analyze_parser.add_argument("--sort", choices=["over", "tiles", "name"], default="over",
+                                help="Row order, most over budget or most tiles first, or by name.")
+    analyze_parser.add_argument("--format", choices=["text", "csv", "json"], default="text")
+    analyze_parser.add_argument("--over", action="store_true", help="Only list images and groups over budget.")
+    analyze_parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: CPU count).")
+    analyze_parser.add_argument("--cache", default=None, help="Tile hash cache (default: .cache/tile_budget.json).")
+    analyze_parser.add_argument("--no-cache", action="store_true", help="Decode every image again.")
+    analyze_parser.set_defaults(handler=analyze)
+
+    list_parser = subparsers.add_parser("list", help="List the available algorithms.")
+    list_parser.set_defaults(handler=list_algorithms)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+import os
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from misc.manifest import Manifest
+from misc.registry import supports_indexed, supports_stream
+
+try:
+    import winshell
+except ImportError:  # Windows only, shortcuts cannot be resolved elsewhere
+    winshell = None
+
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'bmp', 'gif', '.lnk')
+
+
+class BatchJob(NamedTuple):
+    image_name: str
+    input_path: str
+    output_path: str
+    params: str
+
+
+class BatchResult(NamedTuple):
+    job: BatchJob
+    error: Optional[str] = None
+    cancelled: bool = False
+    outputs: Tuple[str, ...] = ()  # Every file written for the job
+
+
+def resolve_shortcut(path: str) -> str:
+    """Returns the target of a Windows .lnk shortcut."""
+    if winshell is None:
+        raise RuntimeError(f"Cannot resolve shortcut '{path}': winshell is not available on this system.")
+    return winshell.Shortcut(path).path
+
+
+def list_images(folder_path: str) -> List[str]:
+    """Names of the image files (and shortcuts to them) in a folder."""
+    return [f for f in os.listdir(folder_path) if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def build_jobs(input_folder_path: str, output_folder_path: str, parameters: str, override: bool,
+               manifest: Optional[Manifest] = None, algorithm_name: str = "") -> Tuple[List[BatchJob], List[str]]:
+    """
+    Creates a job per image in the input folder that writes <name>_processed<ext> to the output folder.
+
+    Images whose output already exists are skipped unless override is set. Every job gets the
+    fname, isref, override and outdir (the output folder, for algorithms that write more files)
+    parameters appended to `parameters`.
+
+    With a manifest the build is incremental: images that are fresh in the manifest are skipped without
+    being decoded, and all other images are processed with override set, since they are out of date.
+
+    Returns:
+        Tuple[List[BatchJob], List[str]]: The jobs and log messages for the skipped images.
+    """
+    jobs, messages = [], []
+    for image_name in list_images(input_folder_path):
+        input_image_path = os.path.join(input_folder_path, image_name)
+
+        name, ext = os.path.splitext(image_name)
+        output_image_name = f"{name}_processed{ext}"
+        output_image_path = os.path.join(output_folder_path, output_image_name)
+
+        if os.path.exists(output_image_path) and not override and manifest is None:
+            messages.append(f"Skipping {image_name}: Output file already exists and force_override is False.")
+            continue
+
+        try:
+            is_ref = input_image_path[-4:] == ".lnk"
+            if is_ref:
+                input_image_path = resolve_shortcut(input_image_path)
+        except Exception as e:
+            messages.append(f"Error processing {image_name}: {e}")
+            continue
+
+        fname_param = " fname=" + input_image_path
+        isref_param = " isref=" + str(is_ref)
+        override_param = " override=" + str(override or manifest is not None)
+        outdir_param = " outdir=" + output_folder_path
+        job_params = parameters + fname_param + isref_param + override_param + outdir_param
+
+        if manifest is not None:
+            try:
+                if manifest.is_fresh(input_image_path, algorithm_name, job_params):
+                    messages.append(f"Skipping {image_name}: Unchanged since the last build.")
+                    continue
+            except OSError as e:
+                messages.append(f"Error processing {image_name}: {e}")
+                continue
+
+        jobs.append(BatchJob(image_name, input_image_path, output_image_path, job_params))
+    return jobs, messages
+
+
+def process_file(algorithm: Callable, input_path: str, output_path: str, params: str,
+                 indexed: bool = False) -> Tuple[str, ...]:
+    """
+    Runs an algorithm on one image file and saves the result. Executed in the worker processes,
+    so the algorithm has to be picklable (a module level function).
+
+    Algorithms that implement process_stream are run band by band when writing PNGs. With indexed,
+    algorithms that support it receive the image as a 'P' image, see misc.indexed.
+
+    Returns:
+        Tuple[str, ...]: The saved image and the files the algorithm reports in its `outputs` attribute.
+    """
+    indexed = indexed and supports_indexed(algorithm)
+    if supports_stream(algorithm) and output_path.lower().endswith('.png'):
+        # Imported here, numpy would otherwise load at every start of the UI and the command line
+        from misc.stream import process_file_stream
+        return process_file_stream(algorithm, input_path, output_path, params, indexed),
+
+    from misc.indexed import load_image
+    image = load_image(input_path, indexed)
+    processed_image = algorithm(image, params=params)
+    processed_image.save(output_path)
+    return (output_path,) + tuple(getattr(processed_image, 'outputs', ()))
+
+
+class BatchRunner:
+    """
+    Processes a list of jobs with one algorithm on a process pool, with indexed in indexed color mode.
+
+    Results are pushed to a thread-safe queue as the jobs finish, in completion order, so a UI can
+    drain them with poll() from its own event loop without blocking.
+    """
+
+    def __init__(self, algorithm: Callable, jobs: List[BatchJob], workers: Optional[int] = None,
+                 indexed: bool = False):
+        self.algorithm = algorithm
+        self.jobs = list(jobs)
+        self.workers = workers
+        self.indexed = indexed
+        self.completed = 0
+        self.results: "queue.Queue[BatchResult]" = queue.Queue()
+        self._futures: List[Future] = []
+
+    def start(self):
+        if not self.jobs:
+            return
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        for job in self.jobs:
+            future = executor.submit(process_file, self.algorithm, job.input_path, job.output_path, job.params,
+                                     self.indexed)
+            future.add_done_callback(partial(self._finished, job))
+            self._futures.append(future)
+        # No more submissions, the pool winds down on its own once the queued jobs are done or cancelled
+        executor.shutdown(wait=False)
+
+    def _finished(self, job: BatchJob, future: Future):
+        # Called from the pool's management thread, only touch the queue here
+        if future.cancelled():
+            self.results.put(BatchResult(job, cancelled=True))
+        elif future.exception() is not None:
+            self.results.put(BatchResult(job, error=str(future.exception())))
+        else:
+            self.results.put(BatchResult(job, outputs=future.result()))
+
+    def cancel(self):
+        """Cancels the jobs that have not started yet, running jobs still finish and report."""
+        for future in self._futures:
+            future.cancel()
+
+    def poll(self) -> List[BatchResult]:
+        """Returns the results that arrived since the last call."""
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                break
+        self.completed += len(results)
+        return results
+
+    def iter_results(self) -> Iterator[BatchResult]:
+        """Blocks and yields the results until every job has reported."""
+        while not self.done:
+            result = self.results.get()
+            self.completed += 1
+            yield result
+
+    @property
+    def done(self) -> bool:
+        return self.completed >= len(self.jobs)
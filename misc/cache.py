@@ -0,0 +1,241 @@
+import glob
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+from functools import lru_cache
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from misc.arg_parse import argdict
+from misc.profiling import stage
+
+
+class PreviewResult(NamedTuple):
+    original: Image.Image
+    processed: Image.Image
+    extra_data: Any = None
+
+
+class PreviewRequest(NamedTuple):
+    key: str
+    image_path: str
+    algorithm: Callable
+    params: str
+    indexed: bool = False  # Load the image as a 'P' image, for algorithms that support it
+
+
+def file_key(path: str, content_hash: bool = False) -> str:
+    """
+    Identifies the current version of a file: its path, modification time and size, or with
+    content_hash the sha1 of its bytes (survives renames and touches, but reads the whole file).
+    """
+    if content_hash:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}"
+
+
+def normalize_params(params: str) -> str:
+    """Parameters in a canonical form, so spacing and order do not produce separate cache entries."""
+    try:
+        return " ".join(f"{key}={value}" for key, value in sorted(argdict(params).items()))
+    except Exception:
+        return " ".join(params.split())
+
+
+def param_file_keys(params: str) -> Tuple[str, ...]:
+    """
+    file_key of every file the parameters name besides the image itself, e.g. the images=a.png,b*.png
+    an algorithm reads too. Values are split on commas and expanded as globs, anything that is not a file
+    is ignored.
+    """
+    try:
+        args = argdict(params)
+    except Exception:
+        return ()
+    keys = []
+    for name, value in sorted(args.items()):
+        if name == 'fname' or not isinstance(value, str):
+            continue
+        for pattern in value.split(','):
+            keys.extend(file_key(path) for path in sorted(glob.glob(pattern.strip())) if os.path.isfile(path))
+    return tuple(keys)
+
+
+@lru_cache(maxsize=1)
+def code_version() -> str:
+    """
+    Identifies the plugins in algorithms/ and the shared helpers in misc/ as they were when the app started,
+    so previews on the disk tier are not reused after any of them changed. Plugins import each other (e.g.
+    the by_ref sprite export runs the o1 one), so a plugin's own mtime is not enough.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    keys = [file_key(path) for folder in ('algorithms', 'misc')
+            for path in sorted(glob.glob(os.path.join(root, folder, '*.py')))]
+    return hashlib.sha1("\n".join(keys).encode()).hexdigest()
+
+
+def cache_key(source_key: str, algorithm_name: str, params: str, algorithm_version: Any = None) -> str:
+    """
+    Key of a preview: the source, algorithm, parameters and algorithm version, plus the other files the
+    parameters name and the version of the plugins and shared helpers.
+    """
+    key = repr((source_key, algorithm_name, normalize_params(params), algorithm_version, param_file_keys(params),
+                code_version()))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def image_bytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of preview results with a memory budget, and an optional on-disk tier.
+
+    The disk tier stores the processed image as PNG and its extra_data pickled next to it, the
+    original is decoded from the source file again when an entry is loaded from disk.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.used_bytes = 0
+        self._entries: "OrderedDict[str, PreviewResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str, source_path: Optional[str] = None, indexed: bool = False) -> Optional[PreviewResult]:
+        """
+        Returns the cached result or None. Disk entries are only considered when the source path is
+        given, since the original image has to be decoded from it (as a 'P' image with indexed).
+        """
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                return result
+
+        if self.disk_dir is None or source_path is None:
+            return None
+        result = self._load(key, source_path, indexed)
+        if result is not None:
+            self.put(key, result, write_disk=False)
+        return result
+
+    def put(self, key: str, result: PreviewResult, write_disk: bool = True):
+        size = image_bytes(result.original) + image_bytes(result.processed)
+        with self._lock:
+            if key in self._entries:
+                old = self._entries.pop(key)
+                self.used_bytes -= image_bytes(old.original) + image_bytes(old.processed)
+            self._entries[key] = result
+            self.used_bytes += size
+            # Evict least recently used entries, but always keep the newest one
+            while self.used_bytes > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self.used_bytes -= image_bytes(old.original) + image_bytes(old.processed)
+
+        if write_disk and self.disk_dir is not None:
+            self._store(key, result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def _paths(self, key: str):
+        return os.path.join(self.disk_dir, key + ".png"), os.path.join(self.disk_dir, key + ".pkl")
+
+    def _load(self, key: str, source_path: str, indexed: bool) -> Optional[PreviewResult]:
+        image_path, data_path = self._paths(key)
+        try:
+            with open(data_path, 'rb') as f:
+                extra_data = pickle.load(f)
+            processed = Image.open(image_path)
+            processed.load()
+            from misc.indexed import load_image  # Not at the top, it loads numpy
+            original = load_image(source_path, indexed)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        os.utime(data_path)  # Mark as recently used for pruning
+        return PreviewResult(original, processed, extra_data)
+
+    def _store(self, key: str, result: PreviewResult):
+        image_path, data_path = self._paths(key)
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            result.processed.save(image_path, format="PNG")
+            with open(data_path, 'wb') as f:
+                pickle.dump(result.extra_data, f)
+        except (OSError, pickle.PicklingError, AttributeError, TypeError):
+            # Unsupported image modes or unpicklable extra data simply stay memory only
+            for path in (image_path, data_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+        self._prune_disk()
+
+    def _prune_disk(self):
+        """Removes the least recently used disk entries until the disk tier fits its budget."""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".pkl"):
+                key = name[:-4]
+                image_path, data_path = self._paths(key)
+                try:
+                    size = os.path.getsize(image_path) + os.path.getsize(data_path)
+                    entries.append((os.path.getmtime(data_path), size, key))
+                except OSError:
+                    continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+
+def compute_preview(cache: ResultCache, request: PreviewRequest, pending: Optional[Future] = None) -> PreviewResult:
+    """
+    Runs the algorithm of a preview request, or returns the cached result of an identical earlier run.
+    Does not touch any GUI state, so it can run on worker threads.
+
+    Args:
+        cache (ResultCache): Cache the result is looked up in and stored to.
+        request (PreviewRequest): Image, algorithm and parameters to run.
+        pending (Optional[Future]): A job that is already computing the same request, it is waited
+            for instead of starting over.
+
+    Returns:
+        PreviewResult: The original image, the processed image and its extra_data.
+    """
+    with stage("cache"):
+        if pending is not None:
+            wait([pending])
+        result = cache.get(request.key, source_path=request.image_path, indexed=request.indexed)
+    if result is not None:
+        return result
+
+    with stage("open"):
+        from misc.indexed import load_image  # Not at the top, it loads numpy
+        image = load_image(request.image_path, request.indexed)
+    with stage("algorithm"):
+        processed_image = request.algorithm(image, params=request.params)
+    result = PreviewResult(image, processed_image, getattr(processed_image, 'extra_data', None))
+    cache.put(request.key, result)
+    return result
@@ -1,29 +1,84 @@
+import ast
+import json
 import os
-import importlib
+from typing import Any, Dict
 
+# Module level constants a plugin can define to describe itself, and the metadata keys they are stored under
+METADATA_CONSTANTS = {
+    'DISPLAY_NAME': 'display_name',
+    'PARAMS': 'params',
+    'WRITES_FILES': 'writes_files',
+    'INDEXED': 'indexed',  # Accepts 'P' images in indexed color mode, see misc.indexed
+}
 
-def modules(package):
-    package_name = package.__name__
-    package_path = package.__path__[0]
+CACHE_VERSION = 2
+
+
+def read_metadata(path: str, module_name: str) -> Dict[str, Any]:
+    """
+    Reads a plugin's metadata from its source without importing it: the literal values of the
+    METADATA_CONSTANTS and the names of its top level functions.
+    """
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    metadata = {'display_name': module_name, 'params': {}, 'writes_files': False, 'indexed': False,
+                'functions': []}
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            metadata['functions'].append(node.name)
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            key = METADATA_CONSTANTS.get(node.targets[0].id)
+            if key is not None:
+                try:
+                    metadata[key] = ast.literal_eval(node.value)
+                except ValueError:
+                    pass
+    return metadata
 
-    print(f"Package name: {package_name}")
-    print(f"Package path: {package_path}")
 
-    py_files = [f for f in os.listdir(package_path) if f.endswith('.py') and f != '__init__.py']
+def discover(package) -> Dict[str, Dict[str, Any]]:
+    """
+    Finds the modules of a package and their metadata without importing any of them.
 
-    imported_modules = {}
+    Metadata is cached in the package's __pycache__ folder and only re-read for files whose
+    modification time or size changed, so a warm start costs one directory listing and a stat per file.
 
-    for py_file in py_files:
+    Returns:
+        Dict[str, Dict[str, Any]]: Metadata per module name, sorted by name.
+    """
+    package_path = package.__path__[0]
+    cache_path = os.path.join(package_path, '__pycache__', 'plugins.json')
+
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+        if cache.get('version') != CACHE_VERSION:
+            cache = {}
+    except (OSError, ValueError):
+        cache = {}
+    cached_plugins = cache.get('plugins', {})
+
+    plugins = {}
+    for py_file in sorted(f for f in os.listdir(package_path) if f.endswith('.py') and f != '__init__.py'):
         module_name = py_file[:-3]  # Strip .py extension
-        full_module_name = f"{package_name}.{module_name}"
-        print(f"Importing module: {full_module_name}")
+        stat = os.stat(os.path.join(package_path, py_file))
+        entry = cached_plugins.get(module_name)
+        if entry is None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+            try:
+                metadata = read_metadata(os.path.join(package_path, py_file), module_name)
+            except SyntaxError as e:
+                print(f"Failed to read {package.__name__}.{module_name}: {e}")
+                continue
+            entry = {'mtime': stat.st_mtime, 'size': stat.st_size, 'metadata': metadata}
+        plugins[module_name] = entry
 
+    if plugins != cached_plugins:
         try:
-            imported_modules[module_name] = importlib.import_module(full_module_name)
-            print(f"Successfully imported {full_module_name}")
-        except ImportError as e:
-            print(f"Failed to import {full_module_name}: {e}")
-        except Exception as e:
-            print(f"Unexpected error importing {full_module_name}: {e}")
-
-    return imported_modules
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'plugins': plugins}, f, indent=1)
+        except OSError:
+            pass  # Read-only installs simply re-read the sources next time
+
+    return {module_name: dict(entry['metadata'], mtime=entry['mtime']) for module_name, entry in plugins.items()}
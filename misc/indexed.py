@@ -0,0 +1,86 @@
+"""
+Indexed color images: one palette index per pixel plus a table of the colors, instead of RGB triples.
+
+Game Boy assets use a handful of colors, so with indexed mode on, images are loaded as 'P' images whose
+palette is normalized (every color once, sorted). Algorithms that declare `INDEXED = True` receive them
+as they are and compare and hash single byte indices, all others still receive RGB images:
+
+    indices, colors = index_array(image)  # Works for 'P' and any other mode
+"""
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+from misc.palette import color_indices
+
+
+def image_palette(image: Image.Image) -> np.ndarray:
+    """The (256, 3) uint8 palette of a 'P' image, padded with black like Pillow does when converting."""
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    entries = np.frombuffer(bytes(image.getpalette('RGB') or ()), dtype=np.uint8).reshape(-1, 3)[:256]
+    palette[:len(entries)] = entries
+    return palette
+
+
+def index_array(image: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Maps an image to indices into its sorted unique colors, the same result as color_indices on its RGB data.
+
+    'P' images are mapped through their palette, without expanding the pixels to RGB first. Palette entries
+    that are not used are left out and entries with the same color are merged.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 2D uint8 indices (wider past 256 colors) and the (n, 3) uint8 colors.
+
+    Examples:
+        >>> image = Image.new('P', (3, 1))
+        >>> image.putpalette([0, 255, 0, 8, 24, 32, 0, 255, 0])
+        >>> image.putdata([2, 1, 0])
+        >>> indices, colors = index_array(image)
+        >>> indices.tolist(), colors.tolist()
+        ([[0, 1, 0]], [[0, 255, 0], [8, 24, 32]])
+    """
+    if image.mode != 'P':
+        return color_indices(np.asarray(image if image.mode == 'RGB' else image.convert('RGB')))
+
+    pixels = np.asarray(image)
+    used = np.flatnonzero(np.bincount(pixels.ravel(), minlength=256))
+    inverse, colors = color_indices(image_palette(image)[used])
+    lut = np.zeros(256, dtype=np.uint8)
+    lut[used] = inverse
+    return lut[pixels], colors
+
+
+def to_indexed(image: Image.Image) -> Image.Image:
+    """
+    The image as a 'P' image with a normalized palette. Images with more than 256 colors cannot be
+    indexed and are returned as RGB.
+    """
+    indices, colors = index_array(image)
+    if len(colors) > 256:
+        return image.convert('RGB')
+    indexed = Image.frombytes('P', image.size, indices.tobytes())
+    indexed.putpalette(colors.tobytes())
+    return indexed
+
+
+def load_image(path: str, indexed: bool = False) -> Image.Image:
+    """Opens an image for an algorithm, as RGB or with indexed set as a normalized 'P' image."""
+    image = Image.open(path)
+    return to_indexed(image) if indexed else image.convert('RGB')
+
+
+def with_color(colors: np.ndarray, color) -> Tuple[np.ndarray, int]:
+    """
+    The index of a color in a color table, for filling padding with it. Appends the color if it is missing.
+
+    Examples:
+        >>> colors, index = with_color(np.array([[255, 255, 255]], dtype=np.uint8), (0, 0, 0))
+        >>> colors.tolist(), index
+        ([[255, 255, 255], [0, 0, 0]], 1)
+    """
+    matches = np.flatnonzero((colors == np.asarray(color, dtype=np.uint8)).all(axis=1))
+    if len(matches):
+        return colors, int(matches[0])
+    return np.concatenate([colors, np.array([color], dtype=np.uint8)]), len(colors)
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, Optional
+
+from misc.arg_parse import argdict
+
+MANIFEST_NAME = ".manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_hash(path: str) -> str:
+    """sha1 of a file's content, read in blocks."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def params_key(params: str) -> str:
+    """
+    The parameters that affect the output, in a canonical order. override only decides whether existing
+    files may be replaced, so it is left out.
+    """
+    try:
+        args = argdict(params)
+    except Exception:
+        return " ".join(params.split())
+    args.pop('override', None)
+    return " ".join(f"{key}={value}" for key, value in sorted(args.items()))
+
+
+class Manifest:
+    """
+    Record of an incremental build: per source image its content hash, the algorithm and parameters it was
+    processed with, and the hash of every file that was written for it.
+
+    A source is fresh, and can be skipped without decoding it, when all of these still match. The stat
+    of the source is remembered too, so unchanged files are not even hashed again.
+    """
+
+    def __init__(self, path: str, entries: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, folder: str) -> "Manifest":
+        """Loads the manifest of an output folder, or starts an empty one."""
+        path = os.path.join(folder, MANIFEST_NAME)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(path)
+        if data.get('version') != MANIFEST_VERSION:
+            return cls(path)
+        return cls(path, data.get('entries', {}))
+
+    def save(self):
+        # Written next to the final file and swapped in, an interrupted save leaves the old manifest intact
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    def _source_hash(self, source_path: str, entry: Optional[Dict[str, Any]]) -> str:
+        stat = os.stat(source_path)
+        if entry is not None and entry.get('mtime') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+            return entry['source']
+        return file_hash(source_path)
+
+    def is_fresh(self, source_path: str, algorithm_name: str, params: str) -> bool:
+        entry = self.entries.get(os.path.abspath(source_path))
+        if entry is None or entry['algorithm'] != algorithm_name or entry['params'] != params_key(params):
+            return False
+        if entry['source'] != self._source_hash(source_path, entry):
+            return False
+        # Outputs that were deleted or edited by hand are rebuilt
+        for output_path, output_hash in entry['outputs'].items():
+            if not os.path.exists(output_path) or file_hash(output_path) != output_hash:
+                return False
+        return True
+
+    def record(self, source_path: str, algorithm_name: str, params: str, outputs: Iterable[str]):
+        key = os.path.abspath(source_path)
+        stat = os.stat(source_path)
+        self.entries[key] = {
+            'source': self._source_hash(source_path, self.entries.get(key)),
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'algorithm': algorithm_name,
+            'params': params_key(params),
+            'outputs': {os.path.abspath(path): file_hash(path) for path in outputs if os.path.exists(path)},
+        }
@@ -0,0 +1,292 @@
+from functools import lru_cache
+from typing import Sequence, Union
+
+import numpy as np
+
+from misc.tiles import pad_to_tiles, tile_view
+
+# The four shades of the original DMG screen, lightest first
+DMG_PALETTE = np.array([
+    [224, 248, 208],  # Lightest gray
+    [136, 192, 112],  # Light gray
+    [52, 104, 86],  # Dark gray
+    [8, 24, 32]  # Black
+], dtype=np.uint8)
+
+PaletteLike = Union[np.ndarray, Sequence[Sequence[int]]]
+
+# Number of pixels compared against the palette at once in the broadcast path.
+# Keeps the temporary (pixels, colors, 3) distance buffer at a few MB.
+_CHUNK_PIXELS = 1 << 16
+
+
+def _as_palette(palette: PaletteLike) -> np.ndarray:
+    palette = np.asarray(palette, dtype=np.int32)
+    if palette.ndim != 2 or palette.shape[1] != 3:
+        raise ValueError(f"Palette must have shape (n, 3), got {palette.shape}.")
+    return palette
+
+
+def _nearest(pixels: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """
+    Index of the closest palette color for every row of an (n, 3) pixel array.
+
+    Uses squared euclidean distance, which picks the same color as the plain euclidean distance
+    (ties resolve to the first palette entry in both cases).
+    """
+    result = np.empty(len(pixels), dtype=np.uint8)
+    for start in range(0, len(pixels), _CHUNK_PIXELS):
+        chunk = pixels[start:start + _CHUNK_PIXELS].astype(np.int32)
+        distances = ((chunk[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2)
+        result[start:start + _CHUNK_PIXELS] = np.argmin(distances, axis=1)
+    return result
+
+
+@lru_cache(maxsize=16)
+def _cached_lut(palette_bytes: bytes, bits: int) -> np.ndarray:
+    palette = np.frombuffer(palette_bytes, dtype=np.int32).reshape(-1, 3)
+    levels = np.arange(1 << bits, dtype=np.int32)
+    # Representative 8 bit value for each level (center of its bucket)
+    values = (levels << (8 - bits)) | ((1 << (8 - bits)) >> 1)
+    r, g, b = np.meshgrid(values, values, values, indexing='ij')
+    colors = np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+    lut = _nearest(colors, palette)
+    lut.setflags(write=False)
+    return lut
+
+
+def build_lut(palette: PaletteLike, bits: int = 5) -> np.ndarray:
+    """
+    Builds (and caches) a color -> palette index lookup table.
+
+    Args:
+        palette (PaletteLike): Palette colors with shape (n, 3), at most 256 entries.
+        bits (int): Bits kept per channel. 5 gives a 32K entry table (the precision of
+            Game Boy Color palettes), 8 gives an exact 16M entry table.
+
+    Returns:
+        np.ndarray: Read-only uint8 table of length 2 ** (3 * bits).
+    """
+    if not 1 <= bits <= 8:
+        raise ValueError(f"bits must be between 1 and 8, got {bits}.")
+    palette = _as_palette(palette)
+    return _cached_lut(np.ascontiguousarray(palette).tobytes(), bits)
+
+
+def quantize_indices(image_array: np.ndarray, palette: PaletteLike, method: str = "broadcast",
+                     bits: int = 5) -> np.ndarray:
+    """
+    Maps every pixel to the index of its closest palette color in one batched operation.
+
+    Args:
+        image_array (np.ndarray): Image data with shape (..., C), C >= 3. Channels past RGB are ignored.
+        palette (PaletteLike): Palette colors with shape (n, 3), at most 256 entries.
+        method (str): 'broadcast' for exact distances, 'lut' for a cached lookup table.
+        bits (int): Bits per channel of the lookup table, only used by 'lut'.
+
+    Returns:
+        np.ndarray: uint8 array with the shape of image_array without the channel axis.
+
+    Examples:
+        >>> quantize_indices(np.array([[[250, 250, 250], [0, 0, 0]]]), DMG_PALETTE)
+        array([[0, 3]], dtype=uint8)
+    """
+    palette = _as_palette(palette)
+    if len(palette) > 256:
+        raise ValueError("Palettes with more than 256 colors are not supported.")
+
+    image_array = np.asarray(image_array)
+    shape = image_array.shape[:-1]
+    pixels = image_array.reshape(-1, image_array.shape[-1])[:, :3]
+
+    if method == "broadcast":
+        indices = _nearest(pixels, palette)
+    elif method == "lut":
+        lut = build_lut(palette, bits)
+        shift = 8 - bits
+        channels = pixels.astype(np.uint32) >> shift
+        indices = lut[(channels[:, 0] << (2 * bits)) | (channels[:, 1] << bits) | channels[:, 2]]
+    else:
+        raise ValueError(f"Unknown quantization method '{method}'.")
+
+    return indices.reshape(shape)
+
+
+def quantize(image_array: np.ndarray, palette: PaletteLike, method: str = "broadcast", bits: int = 5) -> np.ndarray:
+    """
+    Snaps every pixel to its closest palette color.
+
+    Same arguments as quantize_indices, returns a uint8 RGB array of shape (..., 3).
+    """
+    indices = quantize_indices(image_array, palette, method, bits)
+    return np.asarray(palette, dtype=np.uint8)[indices]
+
+
+def color_indices(image_array: np.ndarray):
+    """
+    Maps an RGB image to indices into its own sorted list of unique colors in one np.unique pass.
+
+    Args:
+        image_array (np.ndarray): Image data with shape (..., 3).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: uint8 indices (wider past 256 colors) with the shape of image_array
+            without the channel axis, and the (n, 3) uint8 colors they refer to.
+
+    Examples:
+        >>> indices, colors = color_indices(np.array([[[0, 255, 0], [8, 24, 32], [0, 255, 0]]], dtype=np.uint8))
+        >>> indices.tolist(), colors.tolist()
+        ([[0, 1, 0]], [[0, 255, 0], [8, 24, 32]])
+    """
+    image_array = np.asarray(image_array)
+    rgb = image_array.reshape(-1, image_array.shape[-1])[:, :3].astype(np.uint32)
+    packed = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+    unique, inverse = np.unique(packed, return_inverse=True)
+    colors = np.stack([unique >> 16, (unique >> 8) & 0xFF, unique & 0xFF], axis=1).astype(np.uint8)
+    dtype = np.uint8 if len(unique) <= 1 << 8 else np.uint16 if len(unique) <= 1 << 16 else np.uint32
+    return inverse.astype(dtype).reshape(image_array.shape[:-1]), colors
+
+
+def color_conflicts(indices: np.ndarray, n_colors: int, tile_width: int = 8, tile_height: int = 16) -> np.ndarray:
+    """
+    Which colors appear together in at least one tile.
+
+    Args:
+        indices (np.ndarray): 2D color indices, negative for pixels that do not take part (e.g. fixed colors).
+        n_colors (int): Number of colors the indices refer to.
+        tile_width (int): Tile width, partial tiles at the border count as tiles.
+        tile_height (int): Tile height.
+
+    Returns:
+        np.ndarray: Symmetric (n_colors, n_colors) boolean adjacency matrix with an empty diagonal.
+
+    Examples:
+        >>> color_conflicts(np.array([[0, 1, 2, 2]]), 3, tile_width=2, tile_height=1).astype(int).tolist()
+        [[0, 1, 0], [1, 0, 0], [0, 0, 0]]
+    """
+    tiles = tile_view(pad_to_tiles(np.asarray(indices, dtype=np.int64), tile_width, tile_height, fill=-1),
+                      tile_width, tile_height)
+    tiles = tiles.reshape(-1, tile_width * tile_height)
+
+    # Color presence per tile, then tiles shared by each pair of colors
+    presence = np.zeros((len(tiles), n_colors + 1), dtype=np.uint8)
+    presence[np.arange(len(tiles))[:, None], tiles] = 1  # -1 lands in the extra last column
+    presence = presence[:, :n_colors].astype(np.int32)
+    adjacency = (presence.T @ presence) > 0
+    np.fill_diagonal(adjacency, False)
+    return adjacency
+
+
+def dsatur_coloring(adjacency: np.ndarray) -> np.ndarray:
+    """
+    Colors a conflict graph with the DSatur heuristic: always color the vertex with the most distinctly
+    colored neighbours next (ties by degree), with the lowest free color.
+
+    Returns:
+        np.ndarray: Color per vertex, numbered from 0.
+
+    Examples:
+        >>> triangle_and_leaf = np.array([[0, 1, 1, 0], [1, 0, 1, 0], [1, 1, 0, 1], [0, 0, 1, 0]], dtype=bool)
+        >>> dsatur_coloring(triangle_and_leaf).tolist()
+        [1, 2, 0, 1]
+    """
+    n = len(adjacency)
+    neighbours = [np.flatnonzero(row) for row in adjacency]
+    degrees = [len(vertex_neighbours) for vertex_neighbours in neighbours]
+    neighbour_colors = [set() for _ in range(n)]
+    coloring = np.full(n, -1, dtype=np.intp)
+    uncolored = set(range(n))
+    while uncolored:
+        vertex = max(uncolored, key=lambda v: (len(neighbour_colors[v]), degrees[v], -v))
+        color = next(c for c in range(n) if c not in neighbour_colors[vertex])
+        coloring[vertex] = color
+        uncolored.remove(vertex)
+        for neighbour in neighbours[vertex]:
+            neighbour_colors[neighbour].add(color)
+    return coloring
+
+
+def exact_coloring(adjacency: np.ndarray, group_size: int = 1, node_limit: int = 200_000) -> np.ndarray:
+    """
+    Colors a conflict graph so that the number of color groups, ceil(colors / group_size), is minimal.
+
+    Branch and bound over DSatur orderings, starting from the DSatur result. A new color is only tried when
+    it still fits in fewer groups than the best coloring so far. Once node_limit search nodes are spent the
+    best coloring found so far is returned, so large graphs degrade to the heuristic.
+
+    Examples:
+        >>> cycle = np.roll(np.eye(5, dtype=bool), 1, axis=1) | np.roll(np.eye(5, dtype=bool), -1, axis=1)
+        >>> int(exact_coloring(cycle).max()) + 1
+        3
+    """
+    n = len(adjacency)
+    best = dsatur_coloring(adjacency)
+    if n == 0:
+        return best
+
+    def groups(colors: int) -> int:
+        return -(-colors // group_size)
+
+    neighbours = [np.flatnonzero(row).tolist() for row in adjacency]
+    # Color counts per neighbour color, so a color can be taken back when backtracking
+    neighbour_colors = [dict() for _ in range(n)]
+    coloring = [-1] * n
+    best_groups = groups(int(best.max()) + 1)
+    nodes = 0
+
+    def search(colored: int, used: int) -> bool:
+        """Returns True when the search should stop."""
+        nonlocal best, best_groups, nodes
+        if colored == n:
+            best, best_groups = np.array(coloring, dtype=np.intp), groups(used)
+            return best_groups == 1
+        nodes += 1
+        if nodes > node_limit:
+            return True
+
+        vertex = max((v for v in range(n) if coloring[v] < 0),
+                     key=lambda v: (len(neighbour_colors[v]), len(neighbours[v])))
+        for color in range(min(used + 1, n)):
+            if color in neighbour_colors[vertex]:
+                continue
+            if color == used and groups(used + 1) >= best_groups:
+                break
+            coloring[vertex] = color
+            for neighbour in neighbours[vertex]:
+                neighbour_colors[neighbour][color] = neighbour_colors[neighbour].get(color, 0) + 1
+            stop = search(colored + 1, max(used, color + 1))
+            for neighbour in neighbours[vertex]:
+                neighbour_colors[neighbour][color] -= 1
+                if not neighbour_colors[neighbour][color]:
+                    del neighbour_colors[neighbour][color]
+            coloring[vertex] = -1
+            if stop:
+                return True
+        return False
+
+    search(0, 0)
+    return best
+
+
+def pack_palettes(adjacency: np.ndarray, slots: int = 3, exact: bool = False):
+    """
+    Packs colors into palettes of `slots` entries, where colors that never appear in the same tile
+    can share an entry.
+
+    Args:
+        adjacency (np.ndarray): Color conflicts, see color_conflicts.
+        slots (int): Entries per palette.
+        exact (bool): Search for the minimal number of palettes instead of only using DSatur.
+
+    Returns:
+        List[List[List[int]]]: Per palette, per entry the colors sharing it. Entries are ordered by their
+            lowest color and hold their colors in ascending order.
+
+    Examples:
+        >>> pack_palettes(color_conflicts(np.array([[0, 1, 2, 3]]), 4, tile_width=2, tile_height=1), slots=2)
+        [[[0, 2], [1, 3]]]
+    """
+    coloring = exact_coloring(adjacency, slots) if exact else dsatur_coloring(adjacency)
+    entries = [np.flatnonzero(coloring == color).tolist() for color in range(int(coloring.max(initial=-1)) + 1)]
+    entries.sort(key=lambda entry: entry[0])
+    return [entries[i:i + slots] for i in range(0, len(entries), slots)]
@@ -0,0 +1,146 @@
+"""
+Lightweight per-stage timing for previews and batch runs.
+
+Code marks its stages with the stage() context manager or the timed decorator. They only measure while
+a Profile is being recorded in the current thread (or context), otherwise they cost one lookup:
+
+    with recording() as profile:
+        with stage("open"):
+            image = Image.open(path)
+    print(profile.summary())
+"""
+import cProfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+_active: ContextVar[Optional["Profile"]] = ContextVar("profile", default=None)
+
+
+class Profile:
+    """Durations (and with trace_memory, net allocations) of the stages of one run, merged by stage path."""
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: Dict[Tuple[str, ...], List[float]] = {}  # path -> [seconds, calls, allocated bytes]
+        self.total = 0.0
+        self.peak_bytes = 0
+        self._path: Tuple[str, ...] = ()
+
+    def add(self, path: Tuple[str, ...], seconds: float, allocated: int = 0):
+        entry = self.stages.setdefault(path, [0.0, 0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+        entry[2] += allocated
+
+    def summary(self) -> str:
+        """
+        Compact one line breakdown, nested stages in parentheses.
+
+        Examples:
+            >>> profile = Profile()
+            >>> profile.total = 0.0125
+            >>> profile.add(("algorithm",), 0.01)
+            >>> profile.add(("algorithm", "unique tiles"), 0.004)
+            >>> profile.add(("algorithm", "unique tiles"), 0.002)
+            >>> profile.add(("open",), 0.002)
+            >>> profile.summary()
+            'total 12.5ms: algorithm 10.0ms (unique tiles 6.0ms x2), open 2.0ms'
+        """
+        def describe(path: Tuple[str, ...]) -> str:
+            seconds, calls, allocated = self.stages[path]
+            text = f"{path[-1]} {seconds * 1000:.1f}ms" + (f" x{calls}" if calls > 1 else "")
+            if self.trace_memory:
+                text += f" {allocated / 2 ** 20:+.1f}MB"
+            children = [child for child in self.stages if len(child) == len(path) + 1 and child[:-1] == path]
+            if children:
+                text += " (" + ", ".join(describe(child) for child in children) + ")"
+            return text
+
+        text = f"total {self.total * 1000:.1f}ms"
+        if self.trace_memory:
+            text += f" peak {self.peak_bytes / 2 ** 20:.1f}MB"
+        top_level = [path for path in self.stages if len(path) == 1]
+        if top_level:
+            text += ": " + ", ".join(describe(path) for path in top_level)
+        return text
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times the enclosed block as a stage of the profile being recorded, if any."""
+    profile = _active.get()
+    if profile is None:
+        yield
+        return
+
+    parent = profile._path
+    profile._path = parent + (name,)
+    allocated = tracemalloc.get_traced_memory()[0] if profile.trace_memory else 0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if profile.trace_memory:
+            allocated = tracemalloc.get_traced_memory()[0] - allocated
+        profile._path = parent
+        profile.add(parent + (name,), seconds, allocated)
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """Decorator form of stage(), named after the function by default."""
+    def decorator(fn: Callable) -> Callable:
+        stage_name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def recording(trace_memory: bool = False, profile_path: Optional[str] = None) -> Iterator[Profile]:
+    """
+    Records the stages of the enclosed block into a new Profile.
+
+    Args:
+        trace_memory (bool): Also record net allocations per stage and the peak, with tracemalloc.
+        profile_path (Optional[str]): Additionally run cProfile and dump its stats to this file, for pstats
+            or snakeviz.
+    """
+    profile = Profile(trace_memory)
+    token = _active.set(profile)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if profile_path else None
+    if profiler is not None:
+        profiler.enable()
+
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.total = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        if trace_memory:
+            profile.peak_bytes = tracemalloc.get_traced_memory()[1]
+        if started_tracing:
+            tracemalloc.stop()
+        _active.reset(token)
+
+
+def run_recorded(fn: Callable[[], Any], trace_memory: bool = False,
+                 profile_path: Optional[str] = None) -> Tuple[Any, Profile]:
+    """Calls fn while recording, e.g. on a worker thread, and returns its result together with the profile."""
+    with recording(trace_memory, profile_path) as profile:
+        result = fn()
+    return result, profile
@@ -0,0 +1,67 @@
+import importlib
+from typing import Any, Dict
+
+from PIL import Image
+
+import algorithms
+from misc.dynamic_import import discover
+
+
+def dummy_processing(image: Image.Image, params: str = "") -> Image.Image:
+    """
+    Dummy processing function.
+    Replace with actual image processing logic.
+    """
+    return image  # This does nothing, replace with actual processing.
+
+
+class LazyAlgorithm:
+    """
+    Stands in for an algorithm's process function and imports the algorithm module on the first call.
+
+    Instances only hold the module name and metadata, so they stay cheap to create and can be
+    pickled to worker processes.
+    """
+
+    def __init__(self, module_name: str, metadata: Dict[str, Any]):
+        self.module_name = module_name
+        self.metadata = metadata
+
+    @property
+    def module(self):
+        return importlib.import_module(f"{algorithms.__name__}.{self.module_name}")
+
+    def __call__(self, image: Image.Image, params: str = "") -> Image.Image:
+        return self.module.process(image, params=params)
+
+    def process_stream(self, source, params: str = ""):
+        """The module's optional band streaming variant, see misc.stream."""
+        return self.module.process_stream(source, params=params)
+
+    def __repr__(self) -> str:
+        return f"LazyAlgorithm({self.module_name!r})"
+
+
+def supports_stream(algorithm) -> bool:
+    """Whether a registry entry implements process_stream, decided from its metadata without importing it."""
+    metadata = getattr(algorithm, 'metadata', None) or {}
+    return 'process_stream' in metadata.get('functions', ())
+
+
+def supports_indexed(algorithm) -> bool:
+    """Whether a registry entry declares INDEXED = True (see misc.indexed), decided from its metadata."""
+    metadata = getattr(algorithm, 'metadata', None) or {}
+    return bool(metadata.get('indexed', False))
+
+
+def load_algorithms() -> Dict[str, Any]:
+    """
+    Builds the processing_algorithms registry: the dummy algorithm plus a LazyAlgorithm for every
+    module in the algorithms package, keyed by module name. Neither the algorithms nor any GUI
+    modules are imported.
+    """
+    processing_algorithms = {"Dummy Processing": dummy_processing, }
+    processing_algorithms.update({module_name: LazyAlgorithm(module_name, metadata)
+                                  for module_name, metadata in discover(algorithms).items()
+                                  if 'process' in metadata['functions']})
+    return processing_algorithms
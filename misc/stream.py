@@ -0,0 +1,173 @@
+"""
+Band streaming for large images such as whole world maps.
+
+Algorithms can implement the optional `process_stream(source, params) -> Iterator[np.ndarray]` next to
+`process(image, params)`: it reads horizontal bands of RGB pixels from a BandSource and yields output
+bands of equal width, which the batch runner writes to a PNG as they arrive. Pillow still decodes the
+whole source image, but the algorithm's intermediate copies and the output are then bounded by a band
+plus whatever index the algorithm keeps, instead of several full size copies.
+
+Sources opened from 'P' images can also be read as bands of palette indices, see misc.indexed.
+"""
+import struct
+import zlib
+from typing import BinaryIO, Callable, Iterable, Iterator, Union
+
+import numpy as np
+from PIL import Image
+
+from misc.indexed import image_palette
+from misc.palette import color_indices
+
+DEFAULT_BAND_HEIGHT = 128
+
+
+class BandSource:
+    """
+    An image read as horizontal bands of RGB pixels.
+
+    bands() can be iterated several times, for algorithms that need one pass to gather statistics and
+    another to draw. The source is decoded once by Pillow in its own mode, bands are converted to RGB
+    one at a time.
+
+    For 'P' images, unless indexed is False, index_bands() reads the palette indices instead, mapped to
+    the sorted unique colors of the palette in `colors`, so equal colors always have equal indices.
+    """
+
+    def __init__(self, image: Image.Image, band_height: int = DEFAULT_BAND_HEIGHT, indexed: bool = True):
+        self.image = image
+        self.band_height = band_height
+        self.width, self.height = image.size
+        self.indexed = indexed and image.mode == 'P'
+        self._lut, self.colors = color_indices(image_palette(image)) if self.indexed else (None, None)
+
+    @classmethod
+    def open(cls, path: str, band_height: int = DEFAULT_BAND_HEIGHT, indexed: bool = False) -> "BandSource":
+        return cls(Image.open(path), band_height, indexed)
+
+    def bands(self, align: int = 1) -> Iterator[np.ndarray]:
+        """
+        Yields writable (height, width, 3) uint8 bands from top to bottom.
+
+        Args:
+            align (int): Band heights are rounded up to a multiple of this, e.g. the tile height, so no
+                tile is split between bands. Only the last band can be shorter.
+        """
+        for band in self._crops(align):
+            yield np.array(band if band.mode == 'RGB' else band.convert('RGB'))
+
+    def index_bands(self, align: int = 1) -> Iterator[np.ndarray]:
+        """Yields writable (height, width) uint8 bands of indices into `colors`, for indexed sources only."""
+        if not self.indexed:
+            raise ValueError(f"Index bands need an indexed source, got a '{self.image.mode}' image.")
+        for band in self._crops(align):
+            yield self._lut[np.asarray(band)]
+
+    def _crops(self, align: int) -> Iterator[Image.Image]:
+        band_height = -(-self.band_height // align) * align
+        for y in range(0, self.height, band_height):
+            yield self.image.crop((0, y, self.width, min(self.height, y + band_height)))
+
+
+def collect_bands(bands: Iterable[np.ndarray]) -> np.ndarray:
+    """Stacks the output bands of process_stream into one array, for callers that want a whole image."""
+    return np.concatenate(list(bands))
+
+
+class PngWriter:
+    """
+    Writes a PNG band by band, without knowing its height up front.
+
+    Rows are filtered (none) and compressed as they arrive. The height in the header is patched on
+    close, so the file has to be seekable.
+
+    Examples:
+        >>> import io
+        >>> buffer = io.BytesIO()
+        >>> with PngWriter(buffer, 2) as writer:
+        ...     writer.write(np.zeros((1, 2, 3), dtype=np.uint8))
+        ...     writer.write(np.full((2, 2, 3), 255, dtype=np.uint8))
+        >>> _ = buffer.seek(0)
+        >>> np.asarray(Image.open(buffer))[:, 0].tolist()
+        [[0, 0, 0], [255, 255, 255], [255, 255, 255]]
+    """
+
+    COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}  # Channels to PNG color type: L, LA, RGB, RGBA
+    IDAT_SIZE = 1 << 16
+
+    def __init__(self, fp: Union[str, BinaryIO], width: int, channels: int = 3, compress_level: int = 6):
+        self._own_file = isinstance(fp, str)
+        self.file = open(fp, 'wb') if self._own_file else fp
+        self.width = width
+        self.channels = channels
+        self.height = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_size = 0
+
+        self._start = self.file.tell()
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', self._header())
+
+    def _header(self) -> bytes:
+        return struct.pack('>IIBBBBB', self.width, self.height, 8, self.COLOR_TYPES[self.channels], 0, 0, 0)
+
+    def _chunk(self, chunk_type: bytes, data: bytes):
+        self.file.write(struct.pack('>I', len(data)) + chunk_type + data +
+                        struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+    def _compressed(self, data: bytes):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        if self._pending_size >= self.IDAT_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._chunk(b'IDAT', b''.join(self._pending))
+            self._pending, self._pending_size = [], 0
+
+    def write(self, band: np.ndarray):
+        band = np.asarray(band, dtype=np.uint8).reshape(band.shape[0], self.width, self.channels)
+        # Every row starts with its filter type, 0 (none)
+        rows = np.zeros((band.shape[0], 1 + self.width * self.channels), dtype=np.uint8)
+        rows[:, 1:] = band.reshape(band.shape[0], -1)
+        self._compressed(self._compressor.compress(rows.tobytes()))
+        self.height += band.shape[0]
+
+    def close(self):
+        self._compressed(self._compressor.flush())
+        self._flush()
+        self._chunk(b'IEND', b'')
+
+        # Patch the final height into IHDR, right after the signature and the chunk length and type
+        end = self.file.tell()
+        self.file.seek(self._start + 16)
+        header = self._header()
+        self.file.write(header + struct.pack('>I', zlib.crc32(b'IHDR' + header)))
+        self.file.seek(end)
+        if self._own_file:
+            self.file.close()
+
+    def __enter__(self) -> "PngWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self._own_file:
+            self.file.close()
+            return
+        self.close()
+
+
+def process_file_stream(algorithm: Callable, input_path: str, output_path: str, params: str,
+                        indexed: bool = False) -> str:
+    """
+    Runs a streaming algorithm on one image file and writes its output bands to a PNG. With indexed,
+    palette files are read as index bands.
+    """
+    source = BandSource.open(input_path, indexed=indexed)
+    with PngWriter(output_path, source.width) as writer:
+        for band in algorithm.process_stream(source, params=params):
+            writer.write(band)
+    return output_path
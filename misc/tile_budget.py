@@ -0,0 +1,232 @@
+"""
+Unique tile counts of a whole GB Studio assets folder, checked against the VRAM tile budgets.
+
+Backgrounds are split into 8x8 tiles and sprites into 8x16 tiles. Every image is counted on its own, and
+the images of each subfolder together as a scene group, since tiles they share are only loaded once.
+The tile hashes of every file are cached by modification time, so a rerun only decodes edited images.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from misc.tiles import pad_to_tiles, tile_keys, tile_view
+
+CACHE_PATH = os.path.join('.cache', 'tile_budget.json')
+CACHE_VERSION = 1
+
+BACKGROUND_BUDGET = 192  # Background tiles a scene can load, some projects can use 256
+HASH_LENGTH = 16  # Hex digits kept of each tile's sha1
+
+# Assets subfolder and tile size per kind of image
+KINDS = {
+    'background': ('backgrounds', (8, 8)),
+    'sprite': ('sprites', (8, 16)),
+}
+
+
+class BudgetRow(NamedTuple):
+    kind: str  # background, sprite, background group or sprite group
+    name: str  # Image or group path relative to the assets folder
+    images: int
+    tiles: int
+    budget: Optional[int] = None
+
+    @property
+    def over(self) -> int:
+        """Tiles past the budget, 0 when within or without a budget."""
+        return max(0, self.tiles - self.budget) if self.budget is not None else 0
+
+
+SORT_KEYS = {
+    'name': lambda row: (row.kind, row.name),
+    'tiles': lambda row: (-row.tiles, row.kind, row.name),
+    'over': lambda row: (-row.over, -row.tiles, row.kind, row.name),
+}
+
+
+def tile_hashes(image: Image.Image, tile_width: int, tile_height: int, flips: bool = False) -> List[str]:
+    """
+    Sorted hashes of the unique tiles of an image, incomplete tiles padded with black.
+
+    With flips, tiles that are flipped copies of each other count once: each tile is hashed in its smallest
+    flip variant.
+
+    Examples:
+        >>> image = np.zeros((8, 24, 3), dtype=np.uint8)
+        >>> image[0, 8] = image[0, 23] = 255
+        >>> len(tile_hashes(Image.fromarray(image), 8, 8)), len(tile_hashes(Image.fromarray(image), 8, 8, True))
+        (3, 2)
+    """
+    pixels = pad_to_tiles(np.asarray(image.convert('RGB')), tile_width, tile_height)
+    tiles = tile_view(pixels, tile_width, tile_height).reshape(-1, tile_height, tile_width, 3)
+    variants = np.stack([tiles, tiles[:, :, ::-1], tiles[:, ::-1], tiles[:, ::-1, ::-1]]) if flips else tiles[None]
+
+    # Keys are numbered in sorted order, so the smallest number of a tile is its smallest variant
+    unique_keys, ids = np.unique(tile_keys(variants).ravel(), return_inverse=True)
+    canonical = unique_keys[np.unique(ids.reshape(len(variants), -1).min(axis=0))]
+    return sorted(hashlib.sha1(key.tobytes()).hexdigest()[:HASH_LENGTH] for key in canonical)
+
+
+def file_tile_hashes(path: str, tile_size: Tuple[int, int], flips: bool) -> List[str]:
+    """tile_hashes of an image file. Executed in the worker processes."""
+    with Image.open(path) as image:
+        return tile_hashes(image, tile_size[0], tile_size[1], flips)
+
+
+def find_images(assets_dir: str) -> Dict[str, List[str]]:
+    """PNG paths per kind of image, relative to the assets folder and sorted."""
+    images = {}
+    for kind, (folder, _) in KINDS.items():
+        paths = []
+        for root, _, files in os.walk(os.path.join(assets_dir, folder)):
+            paths.extend(os.path.relpath(os.path.join(root, name), assets_dir)
+                         for name in files if name.lower().endswith('.png'))
+        images[kind] = sorted(paths)
+    return images
+
+
+class TileCache:
+    """Tile hashes per file, tile size and flip mode, valid as long as the file's mtime and size match."""
+
+    def __init__(self, path: Optional[str] = CACHE_PATH):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        if path is None:
+            return
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == CACHE_VERSION:
+            self.entries = data.get('entries', {})
+
+    @staticmethod
+    def _variant(tile_size: Tuple[int, int], flips: bool) -> str:
+        return f"{tile_size[0]}x{tile_size[1]}" + ("f" if flips else "")
+
+    def get(self, path: str, tile_size: Tuple[int, int], flips: bool) -> Optional[List[str]]:
+        entry = self.entries.get(os.path.abspath(path))
+        stat = os.stat(path)
+        if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            return None
+        return entry['tiles'].get(self._variant(tile_size, flips))
+
+    def put(self, path: str, tile_size: Tuple[int, int], flips: bool, hashes: List[str]):
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.entries.get(key)
+        if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            entry = self.entries[key] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'tiles': {}}
+        entry['tiles'][self._variant(tile_size, flips)] = hashes
+
+    def save(self):
+        if self.path is None:
+            return
+        # Files that no longer exist are dropped, then written next to the final file and swapped in
+        self.entries = {key: entry for key, entry in self.entries.items() if os.path.exists(key)}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': self.entries}, f)
+        os.replace(temp_path, self.path)
+
+
+def scan(assets_dir: str, flips: bool = False, cache: Optional[TileCache] = None,
+         workers: Optional[int] = None) -> Tuple[Dict[str, Dict[str, List[str]]], Dict[str, str]]:
+    """
+    Tile hashes of every background and sprite in an assets folder. Files missing from the cache are
+    decoded in parallel on a process pool.
+
+    Returns:
+        Tuple[Dict[str, Dict[str, List[str]]], Dict[str, str]]: Per kind, the tile hashes per image path
+            relative to the assets folder, and the error per image that could not be read.
+    """
+    cache = cache if cache is not None else TileCache(None)
+    hashes = {kind: {} for kind in KINDS}
+    errors = {}
+    stale = []
+    for kind, paths in find_images(assets_dir).items():
+        tile_size = KINDS[kind][1]
+        for path in paths:
+            cached = cache.get(os.path.join(assets_dir, path), tile_size, flips)
+            if cached is None:
+                stale.append((kind, path))
+            else:
+                hashes[kind][path] = cached
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(file_tile_hashes, os.path.join(assets_dir, path), KINDS[kind][1], flips)
+                       for kind, path in stale]
+            for (kind, path), future in zip(stale, futures):
+                try:
+                    hashes[kind][path] = future.result()
+                except Exception as e:
+                    errors[path] = str(e)
+                    continue
+                cache.put(os.path.join(assets_dir, path), KINDS[kind][1], flips, hashes[kind][path])
+
+    # Keep the sorted order of find_images
+    return {kind: dict(sorted(images.items())) for kind, images in hashes.items()}, errors
+
+
+def budget_rows(hashes: Dict[str, Dict[str, List[str]]], background_budget: Optional[int] = BACKGROUND_BUDGET,
+                sprite_budget: Optional[int] = None) -> List[BudgetRow]:
+    """
+    One row per image and one per subfolder (scene group) with the unique tiles of all its images together.
+    Images directly in backgrounds/ or sprites/ are not grouped.
+
+    Examples:
+        >>> town = {os.path.join('backgrounds', 'town', 'a.png'): ['x', 'y'],
+        ...         os.path.join('backgrounds', 'town', 'b.png'): ['y']}
+        >>> for row in budget_rows({'background': town, 'sprite': {}}, background_budget=1):
+        ...     print(row.kind, row.name, row.tiles, row.over)
+        background backgrounds/town/a.png 2 1
+        background backgrounds/town/b.png 1 0
+        background group backgrounds/town 2 1
+    """
+    budgets = {'background': background_budget, 'sprite': sprite_budget}
+    rows = []
+    for kind, images in hashes.items():
+        groups: Dict[str, set] = {}
+        group_sizes: Dict[str, int] = {}
+        for path, tiles in images.items():
+            rows.append(BudgetRow(kind, path.replace(os.sep, '/'), 1, len(tiles), budgets[kind]))
+            group = os.path.dirname(path)
+            if group != KINDS[kind][0]:
+                groups.setdefault(group, set()).update(tiles)
+                group_sizes[group] = group_sizes.get(group, 0) + 1
+        rows.extend(BudgetRow(kind + " group", group.replace(os.sep, '/'), group_sizes[group], len(tiles),
+                              budgets[kind]) for group, tiles in sorted(groups.items()))
+    return rows
+
+
+def format_report(rows: List[BudgetRow], fmt: str = 'text') -> str:
+    """The rows as an aligned text table, CSV or JSON."""
+    fields = list(BudgetRow._fields) + ['over']
+    if fmt == 'json':
+        return json.dumps([dict(row._asdict(), over=row.over) for row in rows], indent=2)
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(fields)
+        writer.writerows(list(row) + [row.over] for row in rows)
+        return buffer.getvalue().rstrip('\n')
+    if fmt != 'text':
+        raise ValueError(f"Unknown report format '{fmt}', expected text, csv or json.")
+
+    width = max([len(row.name) for row in rows] + [4])
+    lines = [f"{'kind':<16} {'name':<{width}} {'images':>6} {'tiles':>6} {'budget':>6}  over"]
+    for row in rows:
+        budget = row.budget if row.budget is not None else '-'
+        over = f"+{row.over}" if row.over else ""
+        lines.append(f"{row.kind:<16} {row.name:<{width}} {row.images:>6} {row.tiles:>6} {budget:>6}  {over}".rstrip())
+    return "\n".join(lines)
@@ -0,0 +1,228 @@
+from typing import Tuple
+
+import numpy as np
+
+from misc.profiling import timed
+
+
+def tile_view(array: np.ndarray, tile_width: int = 8, tile_height: int = 8) -> np.ndarray:
+    """
+    Splits an image array into tiles without copying it.
+
+    Incomplete tiles at the right and bottom edge are left out, use pad_to_tiles first to keep them.
+
+    Args:
+        array (np.ndarray): Image data with shape (height, width) or (height, width, C).
+        tile_width (int): Tile width in pixels.
+        tile_height (int): Tile height in pixels.
+
+    Returns:
+        np.ndarray: View with shape (rows, cols, tile_height, tile_width, C). 2D input gets C = 1.
+
+    Examples:
+        >>> tile_view(np.zeros((20, 17, 3), dtype=np.uint8)).shape
+        (2, 2, 8, 8, 3)
+    """
+    if array.ndim == 2:
+        array = array[..., None]
+    height, width, channels = array.shape
+    rows, cols = height // tile_height, width // tile_width
+    cropped = array[:rows * tile_height, :cols * tile_width]
+    return np.lib.stride_tricks.as_strided(
+        cropped,
+        shape=(rows, cols, tile_height, tile_width, channels),
+        strides=(cropped.strides[0] * tile_height, cropped.strides[1] * tile_width) + cropped.strides,
+        writeable=False)
+
+
+def pad_to_tiles(array: np.ndarray, tile_width: int = 8, tile_height: int = 8, fill=0) -> np.ndarray:
+    """
+    Pads an image array at the right and bottom so its size is a multiple of the tile size,
+    the same way cropping past the image border fills with `fill`. Returns the array itself if no padding is needed.
+    """
+    height, width = array.shape[:2]
+    pad_height = -height % tile_height
+    pad_width = -width % tile_width
+    if not pad_height and not pad_width:
+        return array
+    padded = np.empty((height + pad_height, width + pad_width) + array.shape[2:], dtype=array.dtype)
+    padded[...] = fill
+    padded[:height, :width] = array
+    return padded
+
+
+def tile_keys(tiles: np.ndarray) -> np.ndarray:
+    """
+    Computes an exact, hashable and sortable key for every tile in one pass.
+
+    Args:
+        tiles (np.ndarray): Tiles with shape (..., tile_height, tile_width, C).
+
+    Returns:
+        np.ndarray: Array of fixed size byte strings (void dtype) with the leading shape of `tiles`.
+            Two keys are equal exactly when the tile pixel data is equal.
+    """
+    lead_shape = tiles.shape[:-3]
+    tile_bytes = int(np.prod(tiles.shape[-3:])) * tiles.dtype.itemsize
+    flat = np.ascontiguousarray(tiles).view(np.uint8).reshape(-1, tile_bytes)
+    return flat.view(np.dtype((np.void, tile_bytes))).reshape(lead_shape)
+
+
+def first_occurrence_order(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Like np.unique(keys, return_index=True, return_inverse=True, return_counts=True) on a flat key array,
+    but numbers the unique keys in order of first appearance instead of sort order.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (first index, inverse, counts) per unique key.
+    """
+    _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.ravel()], counts[order]
+
+
+@timed("unique tiles")
+def unique_tiles(tiles: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds the unique tiles of a tile array, e.g. a tile_view of an image.
+
+    Args:
+        tiles (np.ndarray): Tiles with shape (..., tile_height, tile_width, C).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Shaped like np.unique(..., return_inverse=True,
+            return_counts=True), ordered by first appearance (row-major):
+            - unique tiles with shape (n, tile_height, tile_width, C)
+            - inverse indices with the leading shape of `tiles`
+            - number of occurrences of each unique tile
+
+    Examples:
+        >>> image = np.zeros((8, 24), dtype=np.uint8)
+        >>> image[:, 8:16] = 1
+        >>> unique, inverse, counts = unique_tiles(tile_view(image))
+        >>> unique.shape, inverse.tolist(), counts.tolist()
+        ((2, 8, 8, 1), [[0, 1, 0]], [2, 1])
+    """
+    lead_shape = tiles.shape[:-3]
+    flat_tiles = tiles.reshape((-1,) + tiles.shape[-3:])
+    first, inverse, counts = first_occurrence_order(tile_keys(flat_tiles))
+    return flat_tiles[first], inverse.reshape(lead_shape), counts
+
+
+class TileSet:
+    """
+    Order preserving set of unique tiles, filled incrementally from several images or image parts.
+
+    Each batch of tiles is deduplicated with unique_tiles first, so merging costs one dictionary
+    probe per tile that is unique within its batch.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._tiles = []
+        self._empty = np.empty((0, 0, 0, 0), dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def add(self, tiles: np.ndarray) -> np.ndarray:
+        """
+        Adds a batch of tiles with shape (..., tile_height, tile_width, C).
+
+        Returns:
+            np.ndarray: The set index of every tile, with the leading shape of `tiles`.
+        """
+        unique, inverse, _ = unique_tiles(tiles)
+        self._empty = unique[:0]
+        ids = np.empty(len(unique), dtype=np.intp)
+        for i, key in enumerate(tile_keys(unique).tolist()):
+            tile_id = self._ids.setdefault(key, len(self._ids))
+            if tile_id == len(self._tiles):
+                self._tiles.append(unique[i])
+            ids[i] = tile_id
+        return ids[inverse]
+
+    def tiles(self) -> np.ndarray:
+        """All unique tiles in order of first appearance, with shape (n, tile_height, tile_width, C)."""
+        return np.stack(self._tiles) if self._tiles else self._empty
+
+
+# Every byte with its bit order reversed, mirrors the pixels of a packed planar row
+REVERSED_BITS = np.array([int(f"{i:08b}"[::-1], 2) for i in range(256)], dtype=np.uint8)
+
+
+def pack_planar(tiles: np.ndarray, planes: int = 2) -> np.ndarray:
+    """
+    Packs palette index tiles into the planar format of the Game Boy (2bpp with two planes) in one operation.
+
+    Every tile row becomes one byte per plane and 8 pixels, the leftmost pixel in the highest bit,
+    plane 0 holding the lowest index bit.
+
+    Args:
+        tiles (np.ndarray): Palette indices with shape (..., tile_height, tile_width), tile_width a multiple of 8.
+        planes (int): Bits per pixel.
+
+    Returns:
+        np.ndarray: uint8 array with shape (..., tile_height, planes, tile_width // 8).
+
+    Examples:
+        >>> pack_planar(np.array([[0, 1, 2, 3, 0, 0, 0, 3]])).tolist()
+        [[[81], [49]]]
+    """
+    if tiles.shape[-1] % 8:
+        raise ValueError(f"Tile width must be a multiple of 8, got {tiles.shape[-1]}.")
+    shifts = np.arange(planes, dtype=np.uint8).reshape(planes, 1)
+    bits = (np.asarray(tiles, dtype=np.uint16)[..., None, :] >> shifts) & 1
+    return np.packbits(bits.astype(np.uint8), axis=-1)
+
+
+def planar_flips(packed: np.ndarray):
+    """
+    The four flip variants of packed planar tiles with shape (..., tile_height, planes, bytes):
+    as is, horizontally, vertically and both.
+    """
+    h_flip = REVERSED_BITS[packed[..., ::-1]]
+    return packed, h_flip, packed[..., ::-1, :, :], h_flip[..., ::-1, :, :]
+
+
+def tile_bank(packed: np.ndarray, flips: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Deduplicates packed planar tiles into a tile bank, in order of first appearance.
+
+    Args:
+        packed (np.ndarray): Tiles from pack_planar, with shape (..., tile_height, planes, bytes).
+        flips (bool): Also map tiles to a bank tile they are a flipped copy of, for hardware that can flip
+            tiles (CGB background attributes, sprites).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]:
+            - the bank with shape (n, tile_height, planes, bytes), each tile as it first appeared
+            - bank index of every tile, with the leading shape of `packed`
+            - flip bits of every tile (bit 0 horizontal, bit 1 vertical) that turn its bank tile into it
+
+    Examples:
+        >>> tiles = np.zeros((1, 3, 8, 8), dtype=np.uint8)
+        >>> tiles[0, 1, :, 0] = 3
+        >>> tiles[0, 2, :, 7] = 3
+        >>> bank, tilemap, flip_bits = tile_bank(pack_planar(tiles), flips=True)
+        >>> len(bank), tilemap.tolist(), flip_bits.tolist()
+        (2, [[0, 1, 1]], [[0, 0, 1]])
+    """
+    lead_shape = packed.shape[:-3]
+    flat = packed.reshape((-1,) + packed.shape[-3:])
+    if not flips:
+        first, inverse, _ = first_occurrence_order(tile_keys(flat))
+        return flat[first], inverse.reshape(lead_shape), np.zeros(lead_shape, dtype=np.uint8)
+
+    # Tiles sharing their smallest variant id are flipped copies of each other
+    variants = np.stack(planar_flips(flat))
+    _, ids = np.unique(tile_keys(variants).ravel(), return_inverse=True)
+    ids = ids.reshape(len(variants), -1)
+    first, inverse, _ = first_occurrence_order(ids.min(axis=0))
+
+    # Flips are their own inverse, so the variant of a tile that equals its bank tile is also the flip
+    # that turns the bank tile into the tile
+    flip_bits = np.argmax(ids == ids[0, first][inverse], axis=0).astype(np.uint8)
+    return flat[first], inverse.reshape(lead_shape), flip_bits.reshape(lead_shape)
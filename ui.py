@@ -1,11 +1,25 @@
 import os
+import queue
 import time
 import tkinter as tk
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import List
 from tkinter import ttk, messagebox, scrolledtext
 
-import winshell
-from PIL import Image, ImageTk
-from tqdm import tqdm
+from misc.batch import BatchRunner, build_jobs, list_images, resolve_shortcut
+from misc.cache import PreviewRequest, PreviewResult, ResultCache, cache_key, compute_preview, file_key
+from misc.manifest import Manifest
+from misc.profiling import recording, run_recorded
+from misc.registry import supports_indexed
+from viewer import ImageViewer
+
+PREVIEW_CACHE_SIZE = 256 * 1024 * 1024  # Bytes of decoded images kept in memory
+PREVIEW_CACHE_DIR = os.path.join('.cache', 'previews')
+PREFETCH_COUNT = 2  # Images processed ahead on each side of the current one
+PREFETCH_WORKERS = 2
+PREVIEW_WORKERS = 2  # Previews and single image processing, kept apart from the prefetch pool
+PROFILE_DIR = os.path.join('.cache', 'profiles')
 
 
 class ImageProcessingApp:
@@ -22,6 +36,21 @@ class ImageProcessingApp:
         self.selected_algorithm = tk.StringVar(value="Dummy Processing")
         self.selected_upsampling = tk.IntVar(value=1)
         self.force_override = tk.BooleanVar(value=False)
+        self.incremental = tk.BooleanVar(value=False)
+        self.indexed = tk.BooleanVar(value=False)
+        self.log_timings = tk.BooleanVar(value=False)
+        self.worker_count = tk.IntVar(value=os.cpu_count() or 1)
+        self.batch_runner = None
+        self.manifest = None
+        self.result_cache = ResultCache(PREVIEW_CACHE_SIZE, disk_dir=PREVIEW_CACHE_DIR)
+        self.current_preview = None
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        self.prefetch_futures = {}
+        self.prefetch_context = None
+        self.worker_executor = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix="preview")
+        self.ui_queue: "queue.Queue" = queue.Queue()
+        self.preview_generation = 0
+        self.preview_future = None
 
         self.image_files = []
         self.current_image_index = 0
@@ -29,7 +58,7 @@ class ImageProcessingApp:
         self.create_widgets()
         self.style_widgets()
         self.populate_subfolders()
-        self.algorithm_menu.bind("<<ComboboxSelected>>", self.show_preview)
+        self.algorithm_menu.bind("<<ComboboxSelected>>", self.on_algorithm_selected)
 
     def create_widgets(self):
         frame = ttk.Frame(self.root, padding="0 0 0 0")
@@ -45,6 +74,13 @@ class ImageProcessingApp:
         self.preview_area = ttk.Frame(right_frame)
         self.preview_area.pack(fill=tk.X, expand=True, padx=0, pady=0)
 
+        # Original and preview images, scrolled together
+        self.original_viewer = ImageViewer(self.preview_area, "Original Image")
+        self.original_viewer.frame.pack(fill=tk.BOTH, expand=True, padx=0, pady=(0, 0), side="top")
+        self.preview_viewer = ImageViewer(self.preview_area, "Preview Image")
+        self.preview_viewer.frame.pack(fill=tk.BOTH, expand=True, padx=0, pady=(10, 0))
+        self.original_viewer.link(self.preview_viewer)
+
         # Subfolder selection
         subfolder_frame = ttk.LabelFrame(left_frame, text="Select Subfolder", padding="10 10 10 10")
         subfolder_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -75,6 +111,21 @@ class ImageProcessingApp:
         # Bind the entry field to re-enable the submit button when content changes
         self.parameter_entry.bind('<KeyRelease>', self.enable_submit_button)
 
+        # Worker processes and cancel button for batch processing
+        batch_frame = ttk.Frame(algorithm_frame)
+        batch_frame.pack(fill=tk.X, padx=5, side="bottom")
+
+        workers_label = ttk.Label(batch_frame, text="Workers:")
+        workers_label.pack(side=tk.LEFT, padx=5)
+
+        self.workers_spinbox = ttk.Spinbox(batch_frame, from_=1, to=os.cpu_count() or 1, width=3,
+                                           textvariable=self.worker_count)
+        self.workers_spinbox.pack(side=tk.LEFT, padx=5)
+
+        self.cancel_button = ttk.Button(batch_frame, text="Cancel", command=self.cancel_processing,
+                                        state="disabled")
+        self.cancel_button.pack(side=tk.RIGHT, padx=5)
+
         # Process button
         self.process_button = ttk.Button(algorithm_frame, text="Process All Images", command=self.process_all_images)
         self.process_button.pack(expand=True, padx=5, pady=10, side="left", fill=tk.BOTH)
@@ -84,6 +135,15 @@ class ImageProcessingApp:
                                                  variable=self.force_override)
         self.override_checkbox.pack(padx=10, pady=10, side="left")
 
+        self.incremental_checkbox = ttk.Checkbutton(algorithm_frame, text="Only changed images",
+                                                    variable=self.incremental)
+        self.incremental_checkbox.pack(padx=10, pady=10, side="left")
+
+        # Palette images for the algorithms that support them, see misc.indexed
+        self.indexed_checkbox = ttk.Checkbutton(algorithm_frame, text="Indexed colors", variable=self.indexed,
+                                                command=self.on_indexed_changed)
+        self.indexed_checkbox.pack(padx=10, pady=10, side="left")
+
         # Progress bar
         self.progress_bar = ttk.Progressbar(left_frame, orient="horizontal", mode="determinate")
         self.progress_bar.pack(fill=tk.X, padx=10, pady=10)
@@ -91,6 +151,13 @@ class ImageProcessingApp:
         # Log text box
         log_frame = ttk.LabelFrame(left_frame, text="Log", padding="10 10 10 10")
         log_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        # Timing breakdown of every preview, and a cProfile dump of a single run
+        timing_frame = ttk.Frame(log_frame, padding="0 0 0 5")
+        timing_frame.pack(fill=tk.X)
+        ttk.Checkbutton(timing_frame, text="Log timings", variable=self.log_timings).pack(side=tk.LEFT)
+        self.profile_button = ttk.Button(timing_frame, text="Profile Preview", command=self.profile_preview)
+        self.profile_button.pack(side=tk.RIGHT)
         self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, height=15, state='disabled')
         self.log_text.pack(fill=tk.BOTH, expand=True)
 
@@ -119,6 +186,9 @@ class ImageProcessingApp:
         self.process_image_button.pack_configure(
             padx=(self.prev_button.winfo_reqwidth() + 20, self.next_button.winfo_reqwidth() + 20))
 
+        # Results of background work are handed back to the Tk thread through ui_queue
+        self.poll_ui_queue()
+
     # Function to handle parameter submission
     def submit_parameters(self):
         # Disable the button and change its text to "Submitted"
@@ -166,6 +236,21 @@ class ImageProcessingApp:
             self.selected_subfolder.set(subfolders[0])  # Select the first subfolder by default
             self.show_preview()
 
+    def on_algorithm_selected(self, event=None):
+        algorithm = self.processing_algorithms.get(self.selected_algorithm.get(), self.default_algorithm)
+        metadata = getattr(algorithm, 'metadata', None)
+        if metadata:
+            params = " ".join(f"{key}={value}" for key, value in metadata['params'].items())
+            self.log_message(f"{metadata['display_name']}" + (f" - parameters: {params}" if params else "") +
+                             (" - writes files when processing" if metadata['writes_files'] else ""))
+        self.show_preview(event)
+
+    def on_indexed_changed(self):
+        algorithm = self.processing_algorithms.get(self.selected_algorithm.get(), self.default_algorithm)
+        if self.indexed.get() and not supports_indexed(algorithm):
+            self.log_message(f"{self.selected_algorithm.get()} does not support indexed colors, it still gets RGB.")
+        self.display_image(algorithm)
+
     def show_preview(self, event=None):
         if not self.selected_subfolder.get():
             return
@@ -175,9 +260,9 @@ class ImageProcessingApp:
         algorithm = self.processing_algorithms.get(algorithm_name, self.default_algorithm)
 
         input_folder_path = os.path.join(self.input_folder, input_subfolder)
-        self.image_files = [f for f in os.listdir(input_folder_path) if
-                            f.lower().endswith(('png', 'jpg', 'jpeg', 'bmp', 'gif', '.lnk'))]
+        self.image_files = list_images(input_folder_path)
         if not self.image_files:
+            self.update_prefetch_context()
             self.log_message(f"No image files found in the input subfolder '{input_subfolder}'.")
             return
 
@@ -185,111 +270,212 @@ class ImageProcessingApp:
         self.display_image(algorithm)
 
     def update_upsampling(self):
-        algorithm_name = self.selected_algorithm.get()
-        algorithm = self.processing_algorithms.get(algorithm_name, self.default_algorithm)
-        self.display_image(algorithm)
+        # Only the scaling changes, the cached result is shown again
+        self.render_preview()
+
+    def preview_request(self, index: int, algorithm) -> PreviewRequest:
+        """Resolves the image at index and builds its parameters and cache key. Reads widgets, Tk thread only."""
+        input_folder_path = os.path.join(self.input_folder, self.selected_subfolder.get())
+        image_path = os.path.join(input_folder_path, self.image_files[index])
+
+        is_ref = image_path[-4:] == ".lnk"
+
+        if is_ref:
+            image_path = resolve_shortcut(image_path)
+
+        # Get parameters from the input field
+        parameters = self.parameter_entry.get()
+        parameters += " fname=" + image_path + " isref=" + str(is_ref)
+
+        indexed = self.indexed.get() and supports_indexed(algorithm)
+        metadata = getattr(algorithm, 'metadata', None) or {}
+        key = cache_key(file_key(image_path), self.selected_algorithm.get(), parameters,
+                        (metadata.get('mtime'), indexed))
+        return PreviewRequest(key, image_path, algorithm, parameters, indexed)
 
     def display_image(self, algorithm):
+        # Neighbours of the old settings would compete with this preview for the CPU
+        self.update_prefetch_context()
         if not self.image_files:
             return
 
-        def dual_function(fn_a, fn_b):
-            return lambda *x: (fn_a(*x), fn_b(*x))
+        image_name = self.image_files[self.current_image_index]
+        try:
+            request = self.preview_request(self.current_image_index, algorithm)
+        except Exception as e:
+            self.log_message(f"Error previewing {image_name}: {e}")
+            return
 
-        input_subfolder = self.selected_subfolder.get()
-        input_folder_path = os.path.join(self.input_folder, input_subfolder)
-        image_path = os.path.join(input_folder_path, self.image_files[self.current_image_index])
+        # Only the result of the latest request is shown, older ones are dropped when they arrive
+        self.preview_generation += 1
+        generation = self.preview_generation
+        if self.preview_future is not None:
+            self.preview_future.cancel()
+            self.preview_future = None
+
+        timed = self.log_timings.get()
+        if request.key in self.result_cache:
+            self.set_computing(False)
+            with recording() as profile:
+                result = compute_preview(self.result_cache, request)
+            self.show_result(result, algorithm, profile if timed else None)
+            return
 
-        is_ref = image_path[-4:] == ".lnk"
+        # The image may already be processing in the background, wait for that instead of starting over
+        pending = self.prefetch_futures.pop(request.key, None)
+        if pending is not None and pending.cancel():
+            pending = None
+
+        self.set_computing(True)
+        job = partial(compute_preview, self.result_cache, request, pending)
+        if timed:
+            job = partial(run_recorded, job)
+        self.preview_future = self.run_in_background(job, partial(self.preview_done, generation, image_name,
+                                                                  algorithm, timed))
+
+    def preview_done(self, generation: int, image_name: str, algorithm, timed: bool, future: Future):
+        if generation != self.preview_generation:
+            return  # Superseded by a newer request
+
+        self.preview_future = None
+        self.set_computing(False)
+        if future.exception() is not None:
+            self.log_message(f"Error previewing {image_name}: {future.exception()}")
+            return
+        if timed:
+            result, profile = future.result()
+            self.show_result(result, algorithm, profile)
+        else:
+            self.show_result(future.result(), algorithm)
 
-        if is_ref:
-            image_path = winshell.Shortcut(image_path).path
+    def show_result(self, result: PreviewResult, algorithm, profile=None):
+        self.current_preview = result
+        if result.extra_data is not None:
+            self.log_message(str(result.extra_data))
 
-        image = Image.open(image_path).convert('RGB')
+        if profile is None:
+            self.render_preview()
+        else:
+            with recording() as render_profile:
+                self.render_preview(redraw=True)
+            self.log_message(f"Timings - compute {profile.summary()} | render {render_profile.summary()}")
+        self.prefetch_neighbours(algorithm)
 
-        # Get upsampling factor
-        upsampling_factor = self.selected_upsampling.get()
+    def profile_preview(self):
+        """Runs the current preview once more, bypassing the cache, under cProfile and with memory tracing."""
+        if not self.image_files:
+            return
 
-        # Get parameters from the input field
-        parameters = self.parameter_entry.get()
+        algorithm_name = self.selected_algorithm.get()
+        algorithm = self.processing_algorithms.get(algorithm_name, self.default_algorithm)
+        image_name = self.image_files[self.current_image_index]
+        try:
+            request = self.preview_request(self.current_image_index, algorithm)
+        except Exception as e:
+            self.log_message(f"Error previewing {image_name}: {e}")
+            return
 
-        parameters += " fname=" + image_path + " isref=" + str(is_ref)
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_path = os.path.join(PROFILE_DIR, f"{algorithm_name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        job = partial(run_recorded, partial(compute_preview, ResultCache(0), request),
+                      trace_memory=True, profile_path=profile_path)
 
-        # Nearest neighbor upscaling for original and processed images
-        original_upscaled = image.resize((image.width * upsampling_factor, image.height * upsampling_factor),
-                                         Image.NEAREST)
-        # Pass the parameters to the algorithm
-        processed_image = algorithm(image, params=parameters)
-        if hasattr(processed_image, 'extra_data'):
-            self.log_message(str(processed_image.extra_data))
+        self.profile_button.config(state="disabled")
+        self.run_in_background(job, partial(self.profile_done, image_name, profile_path))
 
-        processed_upscaled = processed_image.resize(
-            (processed_image.width * upsampling_factor, processed_image.height * upsampling_factor), Image.NEAREST)
+    def profile_done(self, image_name: str, profile_path: str, future: Future):
+        self.profile_button.config(state="normal")
+        if future.exception() is not None:
+            self.log_message(f"Error profiling {image_name}: {future.exception()}")
+            return
+        _, profile = future.result()
+        self.log_message(f"Profile of {image_name}: {profile.summary()}. "
+                         f"cProfile stats written to {profile_path} (python -m pstats {profile_path})")
+
+    def set_computing(self, computing: bool):
+        # The previous result stays visible until the new one arrives
+        self.root.config(cursor="watch" if computing else "")
+        self.preview_viewer.set_title("Preview Image (computing...)" if computing else "Preview Image")
+
+    def run_in_background(self, fn, on_done) -> Future:
+        """Runs fn on the worker pool, on_done(future) is then called from the Tk event loop."""
+        future = self.worker_executor.submit(fn)
+        future.add_done_callback(lambda f: self.ui_queue.put(partial(on_done, f)))
+        return future
+
+    def poll_ui_queue(self):
+        while True:
+            try:
+                callback = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            # A failing callback must not stop the queue, or no later result would reach the UI
+            try:
+                callback()
+            except Exception as e:
+                self.log_message(f"Error in background result: {e}")
+        self.root.after(50, self.poll_ui_queue)
+
+    def prefetch_neighbours(self, algorithm):
+        """Processes the next and previous PREFETCH_COUNT images in the background, into the result cache."""
+        self.update_prefetch_context()
+
+        count = len(self.image_files)
+        indices = []
+        for offset in range(1, PREFETCH_COUNT + 1):
+            for index in ((self.current_image_index + offset) % count, (self.current_image_index - offset) % count):
+                if index != self.current_image_index and index not in indices:
+                    indices.append(index)
+
+        wanted = {}
+        for index in indices:
+            try:
+                request = self.preview_request(index, algorithm)
+            except Exception:
+                continue  # E.g. a broken shortcut, reported once the image itself is shown
+            wanted[request.key] = request
+
+        # Images that are no longer neighbours are not worth the work anymore
+        for key in list(self.prefetch_futures):
+            if key not in wanted:
+                self.prefetch_futures.pop(key).cancel()
+
+        for key, request in wanted.items():
+            if key in self.prefetch_futures or key in self.result_cache:
+                continue
+            self.prefetch_futures[key] = self.prefetch_executor.submit(compute_preview, self.result_cache, request)
+
+    def update_prefetch_context(self):
+        """Cancels the queued prefetch jobs once the subfolder, algorithm, parameters or indexed mode changed."""
+        context = (self.selected_subfolder.get(), self.selected_algorithm.get(), self.parameter_entry.get(),
+                   self.indexed.get())
+        if context != self.prefetch_context:
+            self.cancel_prefetch()
+            self.prefetch_context = context
+
+    def cancel_prefetch(self):
+        # Running jobs cannot be stopped, they finish into the cache
+        for future in self.prefetch_futures.values():
+            future.cancel()
+        self.prefetch_futures.clear()
+
+    def render_preview(self, redraw: bool = False):
+        """
+        Shows the current preview at the selected upsampling factor, without running the algorithm.
+        The viewers draw when Tk is idle, unless redraw is set (e.g. to time the drawing).
+        """
+        if self.current_preview is None:
+            return
 
-        # Clear the preview area
-        for widget in self.preview_area.winfo_children():
-            widget.destroy()
+        # Get upsampling factor
+        upsampling_factor = self.selected_upsampling.get()
 
-        # Original image section
-        original_frame = ttk.LabelFrame(self.preview_area, text="Original Image", padding="10 10 10 10")
-        original_frame.pack(fill=tk.BOTH, expand=True, padx=0, pady=(0, 0), side="top")
-
-        original_canvas = tk.Canvas(original_frame)
-
-        preview_frame = ttk.LabelFrame(self.preview_area, text="Preview Image", padding="10 10 10 10")
-        preview_canvas = tk.Canvas(preview_frame)
-
-        original_scrollbar_y = ttk.Scrollbar(original_frame, orient="vertical",
-                                             command=dual_function(preview_canvas.yview, original_canvas.yview))
-        original_scrollbar_x = ttk.Scrollbar(original_frame, orient="horizontal",
-                                             command=dual_function(preview_canvas.xview, original_canvas.xview))
-        original_canvas.configure(yscrollcommand=original_scrollbar_y.set, xscrollcommand=original_scrollbar_x.set)
-
-        original_scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
-        original_scrollbar_x.pack(side=tk.TOP, fill=tk.X)
-        original_canvas.pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True)
-
-        original_inner_frame = ttk.Frame(original_canvas)
-        original_canvas.create_window((0, 0), window=original_inner_frame, anchor="nw")
-        original_inner_frame.bind("<Configure>",
-                                  lambda e: original_canvas.configure(scrollregion=original_canvas.bbox("all")))
-
-        original_image_label = tk.Label(original_inner_frame)
-        original_image_label.pack()
-        original_img_tk = ImageTk.PhotoImage(original_upscaled)
-        original_image_label.config(image=original_img_tk)
-        original_image_label.image = original_img_tk
-
-        # Processed image section
-        # preview_frame = ttk.LabelFrame(self.preview_area, text="Preview Image", padding="10 10 10 10")
-        preview_frame.pack(fill=tk.BOTH, expand=True, padx=0, pady=(10, 0))
-
-        preview_scrollbar_y = ttk.Scrollbar(preview_frame, orient="vertical",
-                                            command=dual_function(preview_canvas.yview, original_canvas.yview))
-        preview_scrollbar_x = ttk.Scrollbar(preview_frame, orient="horizontal",
-                                            command=dual_function(preview_canvas.xview, original_canvas.xview))
-        preview_canvas.configure(yscrollcommand=preview_scrollbar_y.set, xscrollcommand=preview_scrollbar_x.set)
-
-        preview_scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
-        preview_scrollbar_x.pack(side=tk.TOP, fill=tk.X)
-        preview_canvas.pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True)
-
-        preview_inner_frame = ttk.Frame(preview_canvas)
-        preview_canvas.create_window((0, 0), window=preview_inner_frame, anchor="nw")
-        preview_inner_frame.bind("<Configure>",
-                                 lambda e: preview_canvas.configure(scrollregion=preview_canvas.bbox("all")))
-
-        preview_image_label = tk.Label(preview_inner_frame)
-        preview_image_label.pack()
-        preview_img_tk = ImageTk.PhotoImage(processed_upscaled)
-        preview_image_label.config(image=preview_img_tk)
-        preview_image_label.image = preview_img_tk
-
-        # Set canvas size to ensure the scrollbars appear as needed
-        original_canvas.update_idletasks()
-        preview_canvas.update_idletasks()
-        original_canvas.configure(scrollregion=original_canvas.bbox("all"))
-        preview_canvas.configure(scrollregion=preview_canvas.bbox("all"))
+        # The viewers upscale only what is visible, nearest neighbor
+        self.original_viewer.show(self.current_preview.original, upsampling_factor)
+        self.preview_viewer.show(self.current_preview.processed, upsampling_factor)
+        if redraw:
+            self.original_viewer.redraw()
+            self.preview_viewer.redraw()
 
     def process_current_image(self):
         if not self.image_files:
@@ -311,7 +497,7 @@ class ImageProcessingApp:
         name, ext = os.path.splitext(image_name)
         is_ref = input_image_path[-4:] == ".lnk"
         if is_ref:
-            input_image_path = winshell.Shortcut(input_image_path).path
+            input_image_path = resolve_shortcut(input_image_path)
             output_image_path = input_image_path
 
         else:
@@ -322,81 +508,119 @@ class ImageProcessingApp:
             self.log_message(f"Skipping {image_name}: Output file already exists and force_override is False.")
             return
 
-        try:
-
-            image = Image.open(input_image_path).convert('RGB')
+        # Get parameters from input field
+        parameters = self.parameter_entry.get()
+        parameters += " fname=" + input_image_path + " isref=" + str(is_ref) + " processing=True"
+        parameters += " override=" + str(self.force_override.get()) + " outdir=" + output_folder_path
+        indexed = self.indexed.get() and supports_indexed(algorithm)
 
-            # Get parameters from input field
-            parameters = self.parameter_entry.get()
-            parameters += " fname=" + input_image_path + " isref=" + str(is_ref) + " processing=True"
-            parameters += " override=" + str(self.force_override.get())
+        def process_image() -> List[str]:
+            # Runs on the worker pool, messages are logged once it is done
+            from misc.indexed import load_image  # Not at the top, it loads numpy
+            image = load_image(input_image_path, indexed)
 
             # Pass parameters to algorithm
             processed_image = algorithm(image, params=parameters)
-            self.log_message(f"Processed image {input_image_path}")
+            messages = [f"Processed image {input_image_path}"]
 
             if hasattr(processed_image, 'no_save') and getattr(processed_image, 'no_save', True):
-                self.log_message(f"Did not save image due to no_save: {output_image_path}")
+                messages.append(f"Did not save image due to no_save: {output_image_path}")
             else:
                 processed_image.save(output_image_path)
-                self.log_message(f"Saved image as {output_image_path}")
+                messages.append(f"Saved image as {output_image_path}")
+            return messages
 
-        except Exception as e:
-            self.log_message(f"Error processing {image_name}: {e}")
+        self.process_image_button.config(state="disabled")
+        self.run_in_background(process_image, partial(self.process_image_done, image_name))
+
+    def process_image_done(self, image_name: str, future: Future):
+        self.process_image_button.config(state="normal")
+        if future.exception() is not None:
+            self.log_message(f"Error processing {image_name}: {future.exception()}")
+            return
+        for message in future.result():
+            self.log_message(message)
 
     def process_all_images(self):
         if not self.selected_subfolder.get():
             self.log_message("No subfolder selected for processing.")
             return
 
+        if self.batch_runner is not None:
+            self.log_message("Processing is already running.")
+            return
+
         input_subfolder = self.selected_subfolder.get()
         output_subfolder = input_subfolder
         algorithm_name = self.selected_algorithm.get()
         algorithm = self.processing_algorithms.get(algorithm_name, self.default_algorithm)
 
-        self.progress_bar.start()
         self.log_message(f"Started processing images in '{input_subfolder}'.")
 
         input_folder_path = os.path.join(self.input_folder, input_subfolder)
-        image_files = [f for f in os.listdir(input_folder_path) if
-                       f.lower().endswith(('png', 'jpg', 'jpeg', 'bmp', 'gif', '.lnk'))]
-
         parameters = self.parameter_entry.get() + " processing=True"  # Get parameters from input field
 
-        total_files = len(image_files)
-        for i, image_name in enumerate(tqdm(image_files, desc="Processing images", unit="image")):
-            input_image_path = os.path.join(input_folder_path, image_name)
-            output_folder_path = os.path.join(self.output_folder, output_subfolder)
-            if not os.path.exists(output_folder_path):
-                os.makedirs(output_folder_path)
+        output_folder_path = os.path.join(self.output_folder, output_subfolder)
+        if not os.path.exists(output_folder_path):
+            os.makedirs(output_folder_path)
 
-            name, ext = os.path.splitext(image_name)
-            output_image_name = f"{name}_processed{ext}"
-            output_image_path = os.path.join(output_folder_path, output_image_name)
+        # Incremental builds skip images that are unchanged since the last run, see misc.manifest
+        self.manifest = Manifest.load(output_folder_path) if self.incremental.get() else None
+        jobs, messages = build_jobs(input_folder_path, output_folder_path, parameters, self.force_override.get(),
+                                    manifest=self.manifest, algorithm_name=algorithm_name)
+        for message in messages:
+            self.log_message(message)
 
-            if os.path.exists(output_image_path) and not self.force_override.get():
-                self.log_message(f"Skipping {image_name}: Output file already exists and force_override is False.")
-                continue
+        if not jobs:
+            self.log_message(f"All images in '{input_subfolder}' have been processed.")
+            return
 
-            try:
-                is_ref = input_image_path[-4:] == ".lnk"
-                if is_ref:
-                    input_image_path = winshell.Shortcut(input_image_path).path
+        self.progress_bar.config(mode="determinate", maximum=len(jobs), value=0)
+        self.process_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
 
-                fname_param = " fname=" + input_image_path
-                isref_param = " isref=" + str(is_ref)
-                override_param = " override=" + str(self.force_override.get())
+        try:
+            workers = max(1, self.worker_count.get())
+        except tk.TclError:
+            workers = os.cpu_count() or 1
+
+        self.batch_runner = BatchRunner(algorithm, jobs, workers, indexed=self.indexed.get())
+        self.batch_runner.start()
+        self.root.after(100, self.poll_batch, input_subfolder, algorithm_name)
+
+    def poll_batch(self, input_subfolder: str, algorithm_name: str):
+        runner = self.batch_runner
+        for result in runner.poll():
+            image_name = result.job.image_name
+            if result.cancelled:
+                self.log_message(f"Cancelled {image_name}.")
+            elif result.error is not None:
+                self.log_message(f"Error processing {image_name}: {result.error}")
+            else:
+                self.log_message(f"Processed and saved image as {os.path.basename(result.job.output_path)}")
+                if self.manifest is not None:
+                    self.manifest.record(result.job.input_path, algorithm_name, result.job.params, result.outputs)
+        self.progress_bar.config(value=runner.completed)
 
-                image = Image.open(input_image_path).convert('RGB')
-                processed_image = algorithm(image, params=parameters+fname_param+isref_param+override_param)
-                processed_image.save(output_image_path)
-                self.log_message(f"Processed and saved image as {output_image_name}")
-            except Exception as e:
-                self.log_message(f"Error processing {image_name}: {e}")
+        if not runner.done:
+            self.root.after(100, self.poll_batch, input_subfolder, algorithm_name)
+            return
 
-        self.progress_bar.stop()
+        if self.manifest is not None:
+            self.manifest.save()
+            self.manifest = None
+        self.batch_runner = None
+        self.process_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
         self.log_message(f"All images in '{input_subfolder}' have been processed.")
 
+    def cancel_processing(self):
+        if self.batch_runner is None:
+            return
+        self.batch_runner.cancel()
+        self.cancel_button.config(state="disabled")
+        self.log_message("Cancelling, images that are already being processed will still finish.")
+
     def show_previous_image(self):
         if not self.image_files:
             return
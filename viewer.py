@@ -0,0 +1,133 @@
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import ttk
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageTk
+
+from misc.profiling import stage
+
+CHUNK_SIZE = 256  # Side of the upscaled chunks in screen pixels
+CHUNK_CACHE_SIZE = 64  # Upscaled chunks kept per viewer, a 1200x800 viewport shows about 20
+
+
+class ImageViewer:
+    """
+    Scrollable, zoomable image view that keeps the source image at 1x.
+
+    Only the chunks of the image that intersect the visible viewport are upscaled (nearest neighbor)
+    and turned into PhotoImages, the most recently used ones are cached. Memory and redraw time thus
+    depend on the window size, not on the zoom level. The widgets live as long as the viewer, showing
+    another image only swaps the source.
+    """
+
+    def __init__(self, parent: tk.Widget, text: str):
+        self.frame = ttk.LabelFrame(parent, text=text, padding="10 10 10 10")
+        self.canvas = tk.Canvas(self.frame, highlightthickness=0)
+        self.scrollbar_y = ttk.Scrollbar(self.frame, orient="vertical", command=self.yview)
+        self.scrollbar_x = ttk.Scrollbar(self.frame, orient="horizontal", command=self.xview)
+        self.canvas.configure(xscrollcommand=self._on_xscroll, yscrollcommand=self._on_yscroll)
+
+        self.scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
+        self.scrollbar_x.pack(side=tk.TOP, fill=tk.X)
+        self.canvas.pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True)
+        self.canvas.bind("<Configure>", lambda e: self.schedule_redraw())
+
+        self.image: Optional[Image.Image] = None
+        self.zoom = 1
+        self.linked: List["ImageViewer"] = []
+        self._chunks: "OrderedDict[Tuple[int, int], ImageTk.PhotoImage]" = OrderedDict()
+        self._items = {}  # Canvas item and its PhotoImage per chunk placed on the canvas
+        self._redraw_pending = False
+
+    def link(self, other: "ImageViewer"):
+        """Scrolls both viewers together, by the same fraction of their images."""
+        self.linked.append(other)
+        other.linked.append(self)
+
+    def set_title(self, text: str):
+        self.frame.config(text=text)
+
+    def show(self, image: Image.Image, zoom: int):
+        if image is self.image and zoom == self.zoom:
+            return
+        self.image = image
+        self.zoom = zoom
+        self._chunks.clear()
+        for item, _ in self._items.values():
+            self.canvas.delete(item)
+        self._items.clear()
+        self.canvas.configure(scrollregion=(0, 0, image.width * zoom, image.height * zoom))
+        self.schedule_redraw()
+
+    def xview(self, *args):
+        for viewer in [self] + self.linked:
+            viewer.canvas.xview(*args)
+
+    def yview(self, *args):
+        for viewer in [self] + self.linked:
+            viewer.canvas.yview(*args)
+
+    def _on_xscroll(self, first, last):
+        self.scrollbar_x.set(first, last)
+        self.schedule_redraw()
+
+    def _on_yscroll(self, first, last):
+        self.scrollbar_y.set(first, last)
+        self.schedule_redraw()
+
+    def schedule_redraw(self):
+        # Scrolling reports once per axis and per step, draw once when the view has settled
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.canvas.after_idle(self.redraw)
+
+    def redraw(self):
+        self._redraw_pending = False
+        if self.image is None:
+            return
+
+        left, top = int(self.canvas.canvasx(0)), int(self.canvas.canvasy(0))
+        right = left + self.canvas.winfo_width()
+        bottom = top + self.canvas.winfo_height()
+        width, height = self.image.width * self.zoom, self.image.height * self.zoom
+
+        visible = set()
+        for y in range(max(0, top) // CHUNK_SIZE, min(bottom, height - 1) // CHUNK_SIZE + 1):
+            for x in range(max(0, left) // CHUNK_SIZE, min(right, width - 1) // CHUNK_SIZE + 1):
+                visible.add((x, y))
+                if (x, y) not in self._items:
+                    # The item keeps its PhotoImage alive even after it drops out of the chunk cache
+                    photo = self._chunk(x, y)
+                    item = self.canvas.create_image(x * CHUNK_SIZE, y * CHUNK_SIZE, anchor="nw", image=photo)
+                    self._items[(x, y)] = (item, photo)
+
+        for chunk in list(self._items):
+            if chunk not in visible:
+                self.canvas.delete(self._items.pop(chunk)[0])
+
+    def _chunk(self, x: int, y: int) -> ImageTk.PhotoImage:
+        photo = self._chunks.get((x, y))
+        if photo is not None:
+            self._chunks.move_to_end((x, y))
+            return photo
+
+        # Source pixels covered by the chunk, rounded outwards so partly covered pixels are included
+        zoom = self.zoom
+        box = (x * CHUNK_SIZE // zoom, y * CHUNK_SIZE // zoom,
+               min(self.image.width, -(-(x + 1) * CHUNK_SIZE // zoom)),
+               min(self.image.height, -(-(y + 1) * CHUNK_SIZE // zoom)))
+        with stage("upscale"):
+            region = self.image.crop(box)
+            region = region.resize((region.width * zoom, region.height * zoom), Image.NEAREST)
+            # Align the upscaled region to the chunk grid
+            offset_x, offset_y = x * CHUNK_SIZE - box[0] * zoom, y * CHUNK_SIZE - box[1] * zoom
+            region = region.crop((offset_x, offset_y, min(region.width, offset_x + CHUNK_SIZE),
+                                  min(region.height, offset_y + CHUNK_SIZE)))
+
+        with stage("photo image"):
+            photo = ImageTk.PhotoImage(region)
+        self._chunks[(x, y)] = photo
+        while len(self._chunks) > CHUNK_CACHE_SIZE:
+            self._chunks.popitem(last=False)
+        return photo